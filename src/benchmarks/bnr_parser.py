@@ -0,0 +1,101 @@
+"""Tree vs streaming BNR xml parsing, run from src as: python -m benchmarks.bnr_parser [years]"""
+import io
+import locale
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from microinvoicer import bnr_feed
+
+CURRENCIES = ["AED", "AUD", "BGN", "BRL", "CAD", "CHF", "CNY", "CZK", "DKK", "EGP", "EUR", "GBP",
+              "HUF", "INR", "JPY", "KRW", "MDL", "MXN", "NOK", "NZD", "PLN", "RSD", "RUB", "SEK",
+              "THB", "TRY", "UAH", "USD", "XAU", "XDR", "ZAR"]  # fmt: skip
+MONTHS = ["ian", "feb", "mar", "apr", "mai", "iun", "iul", "aug", "sep", "oct", "nov", "dec"]
+
+
+def archive(years):
+    """Multi-year daily archive, shaped like the BNR yearly files glued together"""
+    parts = ['<?xml version="1.0" encoding="utf-8"?><DataSet xmlns="http://www.bnr.ro/xsd"><Body>']
+    day = date(2024 - years, 1, 1)
+    while day.year < 2024:
+        if day.weekday() < 5:
+            parts.append(f'<Cube date="{day.isoformat()}">')
+            for index, currency in enumerate(CURRENCIES):
+                multiplier = ' multiplier="100"' if currency in {"HUF", "JPY", "KRW"} else ""
+                parts.append(
+                    f'<Rate currency="{currency}"{multiplier}>{4 + index / 10:.4f}</Rate>'
+                )
+            parts.append("</Cube>")
+        day += timedelta(days=1)
+    parts.append("</Body></DataSet>")
+    return "".join(parts).encode()
+
+
+def monthly(years):
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?><DataSet xmlns="http://www.bnr.ro/xsd"><Table>'
+    ]
+    for year in range(2024 - years, 2024):
+        for month in MONTHS:
+            parts.append(f"<Row><Data>{month}. {year}</Data><CURSL_EURM>4,9224</CURSL_EURM></Row>")
+    parts.append("</Table></DataSet>")
+    return "".join(parts).encode()
+
+
+def tree_daily(content):
+    rates = []
+    for cube in ET.fromstring(content).iter("{http://www.bnr.ro/xsd}Cube"):
+        day = date.fromisoformat(cube.get("date"))
+        for it in cube.iter("{http://www.bnr.ro/xsd}Rate"):
+            rates.append((day, it.get("currency").lower(), Decimal(it.text)))
+    return rates
+
+
+def tree_monthly(content):
+    rates = []
+    previous = locale.setlocale(locale.LC_ALL)
+    locale.setlocale(locale.LC_ALL, "ro_RO")
+    try:
+        for it in ET.parse(io.BytesIO(content)).iter("{http://www.bnr.ro/xsd}Row"):
+            _, data, curs = tuple(it.iter())
+            month = datetime.strptime(data.text, "%b. %Y").date()
+            rates.append((month, "eur", Decimal(locale.atof(curs.text))))
+    finally:
+        locale.setlocale(locale.LC_ALL, previous)
+    return rates
+
+
+def measure(label, parse):
+    try:
+        started = time.perf_counter()
+        count = sum(1 for _ in parse())
+        seconds = time.perf_counter() - started
+    except locale.Error as error:
+        print(f"{label:28} skipped, {error}")
+        return
+
+    # second pass only for memory, tracing slows everything down
+    tracemalloc.start()
+    sum(1 for _ in parse())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:28} {count:9d} rates {seconds:8.3f} s  peak {peak / 2**20:8.2f} MiB")
+
+
+def main(years=20):
+    daily_content, monthly_content = archive(years), monthly(years)
+    print(f"{years} years daily archive: {len(daily_content) / 2**20:.1f} MiB")
+    measure("daily, element tree", lambda: tree_daily(daily_content))
+    measure("daily, streaming", lambda: bnr_feed.iter_daily_rates(io.BytesIO(daily_content)))
+    measure("monthly, tree + locale", lambda: tree_monthly(monthly_content))
+    measure(
+        "monthly, streaming",
+        lambda: bnr_feed.iter_monthly_averages(io.BytesIO(monthly_content)),
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
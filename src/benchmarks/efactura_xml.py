@@ -0,0 +1,42 @@
+"""e-Factura xml generation throughput, batch zip included
+
+Run from src as: python -m benchmarks.efactura_xml [invoices]
+"""
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microtools.settings")
+
+
+def main(count=5000):
+    django.setup()
+    from benchmarks.invoice_html import sample_invoices
+    from microinvoicer import bulk_export, efactura, models
+
+    # romanian buyers only, converted to lei so no exchange rate lookups
+    contract = models.ServiceContract(currency="eur", unit="hr", invoicing_currency="ron")
+    invoices = [invoice for invoice in sample_invoices(2 * count) if invoice.buyer.country == "RO"]
+    for invoice in invoices:
+        invoice.contract = contract
+        invoice.currency = contract.invoicing_currency
+    efactura.invoice_xml(invoices[0])
+
+    started = time.perf_counter()
+    documents = [(f"{invoice.number}.xml", efactura.invoice_xml(invoice)) for invoice in invoices]
+    xml_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in bulk_export.zip_documents(documents))
+    zip_seconds = time.perf_counter() - started
+
+    print(f"xml        {len(invoices) / xml_seconds:10.0f} invoices/s")
+    print(f"zip        {len(invoices) / zip_seconds:10.0f} invoices/s, {size / 2**20:.1f} MiB")
+    print(f"end to end {len(invoices) / (xml_seconds + zip_seconds):10.0f} invoices/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,82 @@
+"""Invoice html generation throughput, pdf conversion excluded
+
+Run from src as: python -m benchmarks.invoice_html [invoices]
+"""
+import os
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microtools.settings")
+
+
+def sample_invoices(count):
+    """Unsaved invoices, half of them for a romanian buyer"""
+    from microinvoicer import models
+
+    seller = models.FiscalEntity(
+        name="Seller SRL",
+        registration_id="J40/1/2020",
+        fiscal_code="RO123",
+        address="Str. Lunga 1\nBucharest, Sector 1",
+        country="RO",
+        bank_account="RO49AAAA1B31007593840000",
+        bank_name="Bank",
+    )
+    buyers = [
+        models.FiscalEntity(name="Client SRL", fiscal_code="RO456", address="Cluj", country="RO"),
+        models.FiscalEntity(name="Client Ltd", fiscal_code="IE78", address="Dublin", country="IE"),
+    ]
+    return [
+        models.TimeInvoice(
+            seller=seller,
+            buyer=buyers[index % 2],
+            series="MI",
+            number=index,
+            status=models.InvoiceStatus.PUBLISHED,
+            description="Software development services",
+            currency="eur",
+            conversion_rate=Decimal("4.9731") if index % 2 == 0 else None,
+            unit="hr",
+            unit_rate=Decimal("45.00"),
+            attached_cost=Decimal("120.50"),
+            attached_description="Travel",
+            issue_date=date(2024, 1 + index % 12, 15),
+            quantity=160 + index % 20,
+            include_vat=19,
+        )
+        for index in range(count)
+    ]
+
+
+def main(count=2000):
+    django.setup()
+    from microinvoicer import pdf_rendering
+
+    invoices = sample_invoices(count)
+    # warm up template and label caches
+    for invoice in invoices[:2]:
+        pdf_rendering.render_html(
+            pdf_rendering.INVOICE_TEMPLATE, pdf_rendering.invoice_context(invoice)
+        )
+
+    started = time.perf_counter()
+    contexts = [pdf_rendering.invoice_context(invoice) for invoice in invoices]
+    context_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for tr_invoice in contexts:
+        pdf_rendering.render_html(pdf_rendering.INVOICE_TEMPLATE, tr_invoice)
+    html_seconds = time.perf_counter() - started
+
+    print(f"context    {count / context_seconds:10.0f} invoices/s")
+    print(f"html       {count / html_seconds:10.0f} invoices/s")
+    print(f"end to end {count / (context_seconds + html_seconds):10.0f} invoices/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,86 @@
+"""HTTP throughput of a running server, run from src as:
+
+    python -m benchmarks.load_test --email a@b.c --password secret /home/ /registry/1/invoice/1/print
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def login(base_url, email, password):
+    session = requests.Session()
+    page = session.get(f"{base_url}/login/")
+    token = CSRF_INPUT.search(page.text).group(1)
+    response = session.post(
+        f"{base_url}/login/",
+        data={"username": email, "password": password, "csrfmiddlewaretoken": token},
+        headers={"Referer": f"{base_url}/login/"},
+        allow_redirects=False,
+    )
+    if response.status_code != 302:
+        raise SystemExit(f"Login failed with status {response.status_code}")
+    return session
+
+
+def hammer(session, url, deadline, latencies, statuses):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = session.get(url)
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] += 1
+
+
+def measure(args, path):
+    """Runs concurrent sessions against one path for the given duration"""
+    url = args.base_url + path
+    sessions = [login(args.base_url, args.email, args.password) for _ in range(args.concurrency)]
+    for session in sessions:
+        session.get(url)  # warm up caches and connections
+
+    latencies, statuses = [], defaultdict(int)
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=hammer, args=(session, url, deadline, latencies, statuses))
+        for session in sessions
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    codes = " ".join(f"{code}x{count}" for code, count in sorted(statuses.items()))
+    print(
+        f"{path:50} {len(latencies) / elapsed:8.1f} req/s  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  {codes}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="for example /home/")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per path")
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients, {args.duration:.0f}s per path against {args.base_url}")
+    for path in args.paths:
+        measure(args, path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Per document latency and peak memory of each pdf backend
+
+Run from src as: python -m benchmarks.pdf_backends [documents]
+"""
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microtools.settings")
+
+
+def measure(backend_name, count, results):
+    """Runs in a fresh process, so peak memory belongs to that backend only"""
+    django.setup()
+    from benchmarks.invoice_html import sample_invoices
+    from microinvoicer import pdf_rendering
+
+    try:
+        backend = pdf_rendering.PDF_BACKENDS[backend_name]()
+        contexts = [pdf_rendering.invoice_context(invoice) for invoice in sample_invoices(count)]
+        backend.render(pdf_rendering.INVOICE_TEMPLATE, contexts[0])
+        timings = []
+        for tr_invoice in contexts:
+            started = time.perf_counter()
+            backend.render(pdf_rendering.INVOICE_TEMPLATE, tr_invoice)
+            timings.append(time.perf_counter() - started)
+    except Exception as error:
+        results.put((backend_name, str(error).splitlines()[0]))
+        return
+
+    # kilobytes on linux, wkhtmltopdf runs as a child process
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    results.put((backend_name, (statistics.median(timings), max(timings), own, children)))
+
+
+def main(count=20):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"{count} invoices per backend")
+    for backend_name in ("wkhtmltopdf", "reportlab"):
+        process = context.Process(target=measure, args=(backend_name, count, results))
+        process.start()
+        name, outcome = results.get()
+        process.join()
+        if isinstance(outcome, str):
+            print(f"{name:12} skipped, {outcome}")
+            continue
+        median, slowest, own, children = outcome
+        print(
+            f"{name:12} median {median * 1000:8.1f} ms  max {slowest * 1000:8.1f} ms"
+            f"  peak rss {own:6.1f} MiB  subprocess {children:6.1f} MiB"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,57 @@
+"""Pdf render latency, local vs remote fonts, run from src as: python -m benchmarks.pdf_fonts"""
+import os
+import re
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microtools.settings")
+
+REMOTE_FONTS = (
+    '<link rel="stylesheet"'
+    ' href="https://fonts.googleapis.com/css?family=Open+Sans:regular,bold"/>'
+)
+# href, src or css url() pointing to another host
+REMOTE_REFERENCE = re.compile(r"""(?:(?:href|src)\s*=\s*|url\(\s*)["']?(?:https?:)?//""")
+
+
+def latency(html, rounds):
+    from microinvoicer.render_engine import html_to_pdf
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        html_to_pdf(html, {"quiet": ""})
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+def main(rounds=10):
+    django.setup()
+    from django.template.loader import render_to_string
+
+    from microinvoicer import pdf_rendering
+
+    failed = False
+    for template_name in (pdf_rendering.INVOICE_TEMPLATE, pdf_rendering.TIMESHEET_TEMPLATE):
+        html = render_to_string(template_name, context={})
+        remote = REMOTE_REFERENCE.findall(html)
+        failed |= bool(remote)
+        print(f"{template_name}: {len(remote)} remote references")
+        try:
+            local_median, local_max = latency(html, rounds)
+            remote_html = html.replace("<head>", "<head>" + REMOTE_FONTS)
+            remote_median, remote_max = latency(remote_html, rounds)
+        except OSError as error:
+            print(f"    skipped rendering, wkhtmltopdf unavailable: {str(error).splitlines()[0]}")
+            continue
+        print(f"    local fonts   median {local_median:8.1f} ms  max {local_max:8.1f} ms")
+        print(f"    google fonts  median {remote_median:8.1f} ms  max {remote_max:8.1f} ms")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Application startup cost, run from src as: python -m benchmarks.startup"""
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microtools.settings")
+
+IO_EVENTS = {"open", "socket.connect", "socket.getaddrinfo", "subprocess.Popen", "os.system"}
+observed = []
+watching = False
+
+
+def audit(event, args):
+    if watching and event in IO_EVENTS:
+        observed.append((event, args))
+
+
+def main(rounds=1000):
+    global watching
+
+    started = time.perf_counter()
+    django.setup()
+    setup_seconds = time.perf_counter() - started
+
+    from django.apps import apps
+
+    app_config = apps.get_app_config("microinvoicer")
+    sys.addaudithook(audit)
+    watching = True
+    started = time.perf_counter()
+    for _ in range(rounds):
+        app_config.ready()
+    ready_seconds = (time.perf_counter() - started) / rounds
+    watching = False
+
+    print(f"django.setup()  {setup_seconds * 1000:10.2f} ms")
+    print(f"ready()         {ready_seconds * 1e6:10.2f} us (mean of {rounds})")
+    print(f"I/O in ready()  {len(observed):10d} events")
+    for event, args in observed[:10]:
+        print(f"    {event} {args}")
+
+    return 1 if observed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""Fake timesheet generation throughput, pdf rendering excluded
+
+Run from src as: python -m benchmarks.timesheets [invoices]
+"""
+import os
+import sys
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microtools.settings")
+
+
+def main(count=20000):
+    django.setup()
+    from benchmarks.invoice_html import sample_invoices
+    from microinvoicer import micro_timesheet, models
+
+    contract = models.ServiceContract(invoicing_description="Services {{ last_month }}")
+    invoices = sample_invoices(count)
+    for invoice in invoices:
+        invoice.contract = contract
+        invoice.registry_id = 1
+
+    started = time.perf_counter()
+    timesheets = [micro_timesheet.invoice_timesheet(invoice) for invoice in invoices]
+    seconds = time.perf_counter() - started
+
+    tasks = sum(len(timesheet["tasks"]) for timesheet in timesheets)
+    exact = all(
+        sum(task["duration"] for task in timesheet["tasks"]) == invoice.quantity
+        for invoice, timesheet in zip(invoices, timesheets)
+    )
+    repeatable = all(
+        micro_timesheet.invoice_timesheet(invoice) == timesheet
+        for invoice, timesheet in zip(invoices[:100], timesheets)
+    )
+    print(f"timesheets {count / seconds:10.0f} invoices/s, {tasks / seconds:.0f} tasks/s")
+    print(f"exact sums {exact}, repeatable {repeatable}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,77 @@
+"""Streaming parsers for BNR xml feeds, memory use does not grow with file size"""
+import re
+import xml.etree.ElementTree as ET
+from datetime import date
+from decimal import Decimal
+
+
+BNR_NAMESPACE = "{http://www.bnr.ro/xsd}"
+# BNR labels monthly series with romanian month abbreviations, like "ian. 2005"
+RO_MONTHS = {
+    "ian": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "mai": 5,
+    "iun": 6,
+    "iul": 7,
+    "aug": 8,
+    "sep": 9,
+    "oct": 10,
+    "nov": 11,
+    "dec": 12,
+}
+AVERAGE_SERIES = re.compile(r"CURSL_([A-Z]{3})M")
+
+
+def iter_daily_rates(source):
+    """Yields (date, currency, lei per unit) from daily or yearly (multi-day) files"""
+    day = None
+    for event, elem in _iterparse(source, container=f"{BNR_NAMESPACE}Cube"):
+        if elem.tag == f"{BNR_NAMESPACE}Cube" and event == "start":
+            day = date.fromisoformat(elem.get("date"))
+        elif elem.tag == f"{BNR_NAMESPACE}Rate" and event == "end":
+            rate = Decimal(elem.text)
+            if multiplier := elem.get("multiplier"):
+                rate /= Decimal(multiplier)
+            yield day, elem.get("currency").lower(), rate
+
+
+def iter_monthly_averages(source):
+    """Yields (first of month, currency, average lei per unit) from monthly series files"""
+    month = None
+    for event, elem in _iterparse(source, container=f"{BNR_NAMESPACE}Row"):
+        if event == "start":
+            continue
+
+        tag = elem.tag.removeprefix(BNR_NAMESPACE)
+        if tag == "Data":
+            month = parse_month(elem.text)
+        elif series := AVERAGE_SERIES.fullmatch(tag):
+            yield month, series.group(1).lower(), parse_number(elem.text)
+
+
+def _iterparse(source, container):
+    """Yields parser events, dropping every container element once it was consumed"""
+    parents = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            yield event, elem
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        yield event, elem
+        if elem.tag == container and parents:
+            # detaches the finished element, and any sibling before it
+            parents[-1].clear()
+
+
+def parse_month(text: str) -> date:
+    name, _, year = text.strip().partition(" ")
+    return date(int(year), RO_MONTHS[name.rstrip(".").lower()], 1)
+
+
+def parse_number(text: str) -> Decimal:
+    """Romanian notation, dot groups thousands and comma separates decimals"""
+    return Decimal(text.strip().replace(".", "").replace(",", "."))
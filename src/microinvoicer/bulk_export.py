@@ -0,0 +1,121 @@
+"""Render all invoices of a period, streamed back as a zip archive"""
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+
+from django.conf import settings
+
+from . import models, pdf_rendering
+from .pdf_cache import invoice_cache
+
+
+class StreamBuffer:
+    """Write only file object, what zip, xml or csv writers wrote since the last drain
+
+    Text is encoded, so every chunk handed back is bytes.
+    """
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+        self.chunks = []
+
+    def write(self, data):
+        if isinstance(data, str):
+            self.chunks.append(data.encode(self.encoding))
+        else:
+            self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        content = b"".join(self.chunks)
+        self.chunks = []
+        return content
+
+
+def parse_period(quarter=None, since=None, until=None):
+    """Accepts either a quarter like 2024Q1 or an ISO date range"""
+    if quarter:
+        year, _, number = quarter.upper().partition("Q")
+        return models.quarter_bounds(int(year), f"Q{number}")
+    if since and until:
+        since, until = date.fromisoformat(since), date.fromisoformat(until)
+        if since > until:
+            raise ValueError("Period start must not be after its end")
+        return since, until
+    raise ValueError("Either a quarter or both since and until dates are required")
+
+
+def archive_name(registry, since, until):
+    quarter = models.quarter_of(since)
+    if (since, until) == models.quarter_bounds(since.year, quarter):
+        return f"{registry.invoice_series}-{since.year}{quarter}.zip"
+    return f"{registry.invoice_series}-{since.isoformat()}-{until.isoformat()}.zip"
+
+
+def period_invoices(registry, since, until):
+    return (
+        registry.invoices.filter(issue_date__range=(since, until))
+        .select_related("seller", "buyer")
+        .order_by("issue_date", "number")
+    )
+
+
+def invoice_documents(invoices):
+    """Yields (filename, pdf content) in issue order, rendered one at a time in this thread
+
+    Renders go through the shared renderer pool and the pdf cache, the way single downloads do,
+    so a web worker never forks processes of its own.
+    """
+    for invoice in invoices.iterator(chunk_size=100):
+        yield f"{invoice.series_number}.pdf", pdf_rendering.invoice_pdf(invoice)
+
+
+def render_invoices(invoices, workers=None):
+    """Yields (filename, pdf content) in issue order, from worker processes of the command
+
+    No more than twice the workers count of documents are in flight.
+    """
+    workers = workers or settings.PDF_EXPORT_WORKERS
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for invoice in invoices.iterator(chunk_size=100):
+            pending.append(_submit(executor, invoice))
+            if len(pending) >= 2 * workers:
+                yield _collect(*pending.popleft())
+
+        while pending:
+            yield _collect(*pending.popleft())
+
+
+def zip_documents(documents):
+    """Yields zip archive chunks, one document at a time"""
+    stream = StreamBuffer()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, content in documents:
+            archive.writestr(filename, content)
+            yield stream.drain()
+    yield stream.drain()
+
+
+def _submit(executor, invoice):
+    tr_invoice = pdf_rendering.invoice_context(invoice)
+    key = pdf_rendering.document_key(pdf_rendering.INVOICE_TEMPLATE, tr_invoice)
+    content = invoice_cache.get(invoice.pk, key)
+    if content is None:
+        content = executor.submit(
+            pdf_rendering.render_document, pdf_rendering.INVOICE_TEMPLATE, tr_invoice
+        )
+
+    return invoice, key, content
+
+
+def _collect(invoice, key, content):
+    if isinstance(content, Future):
+        content = content.result()
+        invoice_cache.put(invoice.pk, key, content)
+
+    return f"{invoice.series_number}.pdf", content
@@ -0,0 +1,385 @@
+"""Romanian e-Factura documents, UBL 2.1 invoices following the CIUS-RO specification"""
+import re
+import unicodedata
+import xml.etree.ElementTree as ET
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+from lxml import etree
+
+from . import bulk_export, models
+from .exchange_rates import rate_store
+
+# official OASIS UBL 2.1 schemas, CIUS-RO rules on top of them are schematron only
+SCHEMA_DIR = Path(__file__).parent / "ubl-xsd"
+CUSTOMIZATION_ID = "urn:cen.eu:en16931:2017#compliant#urn:efactura.mfinante.ro:CIUS-RO:1.0.1"
+NAMESPACES = {
+    "": "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2",
+    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+}
+for prefix, uri in NAMESPACES.items():
+    ET.register_namespace(prefix, uri)
+
+
+class DocumentType(NamedTuple):
+    name: str
+    namespace: str
+    type_code: str
+    line: str
+    quantity: str
+
+
+INVOICE = DocumentType("Invoice", NAMESPACES[""], "380", "InvoiceLine", "InvoicedQuantity")
+# a storno invoice is cancelled by a credit note referencing it
+CREDIT_NOTE = DocumentType(
+    "CreditNote",
+    "urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2",
+    "381",
+    "CreditNoteLine",
+    "CreditedQuantity",
+)
+
+# UN/ECE recommendation 20 unit codes
+UNIT_CODES = {"mo": "MON", "d": "DAY", "hr": "HUR"}
+# reason code and text of the zero rated categories
+EXEMPTIONS = {
+    "AE": ("VATEX-EU-AE", "Taxare inversa"),
+    "E": ("VATEX-EU-79-C", "Cheltuieli refacturate"),
+    "O": ("VATEX-EU-O", "Neplatitor de TVA"),
+}
+CREDIT_TRANSFER = "30"
+# BR-CO-25, there is no due date to state so payment is due on receipt
+PAYMENT_TERMS = "Plata la primirea facturii"
+CENT = Decimal("0.01")
+# ISO 3166-2:RO codes by county, or county seat, spelled without diacritics
+COUNTIES = {
+    "alba": "AB",
+    "arad": "AR",
+    "arges": "AG",
+    "pitesti": "AG",
+    "bacau": "BC",
+    "bihor": "BH",
+    "oradea": "BH",
+    "bistrita": "BN",
+    "bistrita-nasaud": "BN",
+    "botosani": "BT",
+    "brasov": "BV",
+    "braila": "BR",
+    "bucuresti": "B",
+    "bucharest": "B",
+    "buzau": "BZ",
+    "caras-severin": "CS",
+    "resita": "CS",
+    "calarasi": "CL",
+    "cluj": "CJ",
+    "constanta": "CT",
+    "covasna": "CV",
+    "sfantu gheorghe": "CV",
+    "dambovita": "DB",
+    "targoviste": "DB",
+    "dolj": "DJ",
+    "craiova": "DJ",
+    "galati": "GL",
+    "giurgiu": "GR",
+    "gorj": "GJ",
+    "targu jiu": "GJ",
+    "harghita": "HR",
+    "miercurea ciuc": "HR",
+    "hunedoara": "HD",
+    "deva": "HD",
+    "ialomita": "IL",
+    "slobozia": "IL",
+    "iasi": "IS",
+    "ilfov": "IF",
+    "maramures": "MM",
+    "baia mare": "MM",
+    "mehedinti": "MH",
+    "drobeta-turnu severin": "MH",
+    "mures": "MS",
+    "targu mures": "MS",
+    "neamt": "NT",
+    "olt": "OT",
+    "slatina": "OT",
+    "prahova": "PH",
+    "ploiesti": "PH",
+    "satu mare": "SM",
+    "salaj": "SJ",
+    "zalau": "SJ",
+    "sibiu": "SB",
+    "suceava": "SV",
+    "teleorman": "TR",
+    "alexandria": "TR",
+    "timis": "TM",
+    "timisoara": "TM",
+    "tulcea": "TL",
+    "vaslui": "VS",
+    "valcea": "VL",
+    "ramnicu valcea": "VL",
+    "vrancea": "VN",
+    "focsani": "VN",
+}
+COUNTY_NAMES = "|".join(map(re.escape, sorted(COUNTIES, key=len, reverse=True)))
+COUNTY = re.compile(rf"\b(?P<name>{COUNTY_NAMES})\b")
+COUNTY_AFTER_PREFIX = re.compile(rf"\bjud(?:etul|\.)?\s*(?P<name>{COUNTY_NAMES})\b")
+SECTOR = re.compile(r"\bsector(?:ul)?\s*(?P<number>[1-6])\b")
+
+
+def element(parent, tag, text=None, **attributes):
+    """Appends a child named with its namespace prefix, cbc:ID for instance"""
+    prefix, _, name = tag.rpartition(":")
+    child = ET.SubElement(parent, f"{{{NAMESPACES[prefix]}}}{name}", attributes)
+    if text is not None:
+        child.text = str(text)
+    return child
+
+
+def amount(parent, tag, value, currency):
+    return element(parent, tag, f"{value:.2f}", currencyID=currency)
+
+
+def rounded(value) -> Decimal:
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def document_type(invoice: models.TimeInvoice) -> DocumentType:
+    return CREDIT_NOTE if invoice.status == models.InvoiceStatus.STORNO else INVOICE
+
+
+def document_id(invoice: models.TimeInvoice) -> str:
+    if document_type(invoice) is CREDIT_NOTE:
+        return f"{invoice.series_number}-STORNO"
+    return invoice.series_number
+
+
+def invoice_xml(invoice: models.TimeInvoice) -> bytes:
+    """The invoice as a UBL document, a credit note once storno, amounts in invoicing currency"""
+    currency = invoice.currency.upper()
+    lines = invoice_lines(invoice)
+    document = document_type(invoice)
+
+    # ElementTree has a single default namespace to give, the root declares its own instead
+    root = ET.Element(document.name, xmlns=document.namespace)
+    element(root, "cbc:CustomizationID", CUSTOMIZATION_ID)
+    element(root, "cbc:ID", document_id(invoice))
+    element(root, "cbc:IssueDate", invoice.issue_date.isoformat())
+    element(root, f"cbc:{document.name}TypeCode", document.type_code)
+    if invoice.conversion_rate:
+        source = invoice.contract_currency.upper()
+        note = f"Curs BNR 1 {source} = {invoice.conversion_rate:.4f} {currency}"
+        element(root, "cbc:Note", note)
+    element(root, "cbc:DocumentCurrencyCode", currency)
+
+    to_ron = None
+    if invoice.currency != models.AvailableCurrencies.RON:
+        to_ron = ron_rate(invoice.currency, invoice.issue_date, invoice.series_number)
+        element(root, "cbc:TaxCurrencyCode", "RON")
+
+    if document is CREDIT_NOTE:
+        reference = element(element(root, "cac:BillingReference"), "cac:InvoiceDocumentReference")
+        element(reference, "cbc:ID", invoice.series_number)
+        element(reference, "cbc:IssueDate", invoice.issue_date.isoformat())
+
+    party(element(root, "cac:AccountingSupplierParty"), invoice.seller)
+    party(element(root, "cac:AccountingCustomerParty"), invoice.buyer)
+
+    payment = element(root, "cac:PaymentMeans")
+    element(payment, "cbc:PaymentMeansCode", CREDIT_TRANSFER)
+    account = element(payment, "cac:PayeeFinancialAccount")
+    element(account, "cbc:ID", invoice.seller.bank_account)
+    element(account, "cbc:Name", invoice.seller.bank_name)
+    element(element(root, "cac:PaymentTerms"), "cbc:Note", PAYMENT_TERMS)
+
+    # one subtotal per (category, percent)
+    subtotals = dict()
+    for line in lines:
+        subtotals[line["category"]] = subtotals.get(line["category"], 0) + line["value"]
+    taxes = [
+        (category, percent, taxable, rounded(taxable * percent / 100))
+        for (category, percent), taxable in subtotals.items()
+    ]
+    tax_total = element(root, "cac:TaxTotal")
+    total_tax = sum(tax for *_, tax in taxes)
+    amount(tax_total, "cbc:TaxAmount", total_tax, currency)
+    for category, percent, taxable, tax in taxes:
+        subtotal = element(tax_total, "cac:TaxSubtotal")
+        amount(subtotal, "cbc:TaxableAmount", taxable, currency)
+        amount(subtotal, "cbc:TaxAmount", tax, currency)
+        tax_category(subtotal, "cac:TaxCategory", category, percent, exemption=True)
+    if to_ron:
+        amount(element(root, "cac:TaxTotal"), "cbc:TaxAmount", rounded(total_tax * to_ron), "RON")
+
+    net = sum(line["value"] for line in lines)
+    totals = element(root, "cac:LegalMonetaryTotal")
+    amount(totals, "cbc:LineExtensionAmount", net, currency)
+    amount(totals, "cbc:TaxExclusiveAmount", net, currency)
+    amount(totals, "cbc:TaxInclusiveAmount", net + total_tax, currency)
+    amount(totals, "cbc:PayableAmount", net + total_tax, currency)
+
+    for index, line in enumerate(lines, start=1):
+        invoice_line = element(root, f"cac:{document.line}")
+        element(invoice_line, "cbc:ID", index)
+        element(invoice_line, f"cbc:{document.quantity}", line["quantity"], unitCode=line["unit"])
+        amount(invoice_line, "cbc:LineExtensionAmount", line["value"], currency)
+        item = element(invoice_line, "cac:Item")
+        element(item, "cbc:Name", line["name"][:100])
+        tax_category(item, "cac:ClassifiedTaxCategory", *line["category"])
+        price = element(invoice_line, "cac:Price")
+        element(price, "cbc:PriceAmount", f"{line['price']:.4f}", currencyID=currency)
+
+    return ET.tostring(root, encoding="UTF-8", xml_declaration=True)
+
+
+def invoice_lines(invoice: models.TimeInvoice) -> list:
+    """Worked time and the attached cost, which the pdf also shows without VAT"""
+    if invoice.include_vat:
+        category = ("S", Decimal(invoice.include_vat))
+    elif invoice.buyer.country != "RO":
+        category = ("AE", Decimal(0))
+    else:
+        category = ("O", Decimal(0))
+    price = invoice.unit_rate * (invoice.conversion_rate or 1)
+    lines = [
+        dict(
+            name=invoice.description or invoice.get_unit_display(),
+            quantity=invoice.quantity,
+            unit=UNIT_CODES[invoice.unit],
+            price=price,
+            value=rounded(invoice.time_value()),
+            category=category,
+        )
+    ]
+    if invoice.attached_cost:
+        lines.append(
+            dict(
+                name=invoice.attached_description or "-",
+                quantity=1,
+                unit="C62",
+                price=invoice.attached_cost,
+                value=rounded(invoice.attached_cost),
+                category=category if category[0] == "O" else ("E", Decimal(0)),
+            )
+        )
+    return lines
+
+
+def ron_rate(currency, day, needed_by) -> Decimal:
+    """Lei for one unit of currency, the tax total in lei can not be left out"""
+    rate = rate_store.conversion(currency, models.AvailableCurrencies.RON, day)
+    if rate is None:
+        raise ValueError(f"No BNR rate for {currency} on {day}, needed by {needed_by}")
+    return rate
+
+
+def party(parent, entity: models.FiscalEntity):
+    details = element(parent, "cac:Party")
+    address = element(details, "cac:PostalAddress")
+    street, city = address_parts(entity)
+    county = None
+    if entity.country == "RO":
+        county, sector = romanian_region(entity)
+        city = sector or city
+    element(address, "cbc:StreetName", street)
+    element(address, "cbc:CityName", city)
+    if county:
+        element(address, "cbc:CountrySubentity", f"RO-{county}")
+    element(element(address, "cac:Country"), "cbc:IdentificationCode", entity.country.code)
+
+    # a country prefix marks a VAT registered company, like RO12345678
+    if entity.fiscal_code[:2].isalpha():
+        tax_scheme = element(details, "cac:PartyTaxScheme")
+        element(tax_scheme, "cbc:CompanyID", entity.fiscal_code)
+        element(element(tax_scheme, "cac:TaxScheme"), "cbc:ID", "VAT")
+    legal_entity = element(details, "cac:PartyLegalEntity")
+    element(legal_entity, "cbc:RegistrationName", entity.name)
+    element(legal_entity, "cbc:CompanyID", entity.fiscal_code)
+
+
+def address_parts(entity: models.FiscalEntity):
+    """Street and city of a free text address, the city being on its last line"""
+    street, _, city = entity.address.strip().rpartition("\n")
+    return " ".join((street or city).split()), city.strip()
+
+
+def romanian_region(entity: models.FiscalEntity):
+    """County code of the address, and the city name CIUS-RO wants for a Bucharest sector"""
+    address = plain(entity.address)
+    county = (
+        COUNTY_AFTER_PREFIX.search(address)
+        or COUNTY.search(address.rpartition("\n")[2])
+        or COUNTY.search(address)
+    )
+    if county is None:
+        raise ValueError(f"No county (judet) in the address of {entity.name}")
+
+    code = COUNTIES[county.group("name")]
+    if code != "B":
+        return code, None
+
+    sector = SECTOR.search(address)
+    if sector is None:
+        raise ValueError(f"No Bucharest sector in the address of {entity.name}")
+    return code, f"SECTOR{sector.group('number')}"
+
+
+def plain(text: str) -> str:
+    """Lower case, without diacritics"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def tax_category(parent, tag, category, percent, exemption=False):
+    details = element(parent, tag)
+    element(details, "cbc:ID", category)
+    if category != "O":
+        element(details, "cbc:Percent", f"{percent:.2f}")
+    if exemption and category in EXEMPTIONS:
+        code, reason = EXEMPTIONS[category]
+        element(details, "cbc:TaxExemptionReasonCode", code)
+        element(details, "cbc:TaxExemptionReason", reason)
+    element(element(details, "cac:TaxScheme"), "cbc:ID", "VAT")
+
+
+def period_invoices(registry, since, until):
+    """Published and storno invoices of romanian buyers, in issue order"""
+    return bulk_export.period_invoices(registry, since, until).filter(
+        buyer__country="RO",
+        status__in=[models.InvoiceStatus.PUBLISHED, models.InvoiceStatus.STORNO],
+    )
+
+
+def check_period(registry, since, until):
+    """Raises the ValueError a document of the period would, before any gets streamed"""
+    invoices = period_invoices(registry, since, until)
+    buyers = models.FiscalEntity.objects.filter(pk__in=invoices.values("buyer"))
+    for entity in (registry.seller, *buyers):
+        if entity.country == "RO":
+            romanian_region(entity)
+
+    foreign = invoices.exclude(currency=models.AvailableCurrencies.RON)
+    for currency, day in foreign.values_list("currency", "issue_date").distinct():
+        ron_rate(currency, day, f"invoices of {day}")
+
+
+def period_documents(registry, since, until):
+    """Yields (filename, xml) for the invoices and credit notes of a period, in issue order"""
+    invoices = period_invoices(registry, since, until)
+    for invoice in invoices.select_related("contract").iterator(chunk_size=500):
+        yield f"{document_id(invoice)}.xml", invoice_xml(invoice)
+
+
+@lru_cache(maxsize=None)
+def ubl_schema(name: str):
+    """Compiled UBL 2.1 schema of a document type, Invoice or CreditNote"""
+    return etree.XMLSchema(etree.parse(str(SCHEMA_DIR / "maindoc" / f"UBL-{name}-2.1.xsd")))
+
+
+def schema_errors(document: bytes) -> list:
+    """Messages of the UBL 2.1 schema violations, empty for a valid document"""
+    root = etree.fromstring(document)
+    schema = ubl_schema(etree.QName(root).localname)
+    if schema.validate(root):
+        return []
+    return [f"line {error.line}: {error.message}" for error in schema.error_log]
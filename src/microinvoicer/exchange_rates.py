@@ -0,0 +1,213 @@
+"""BNR exchange rates, kept in the database and downloaded outside of requests"""
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+import requests
+import urllib3
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .bnr_feed import iter_daily_rates, iter_monthly_averages
+from .models import ExchangeRate, RateFeed, RateSeries, TimeInvoice
+
+
+MONTHLY_AVERAGE_XML = Path(__file__).parent / "bnr-data" / "bnr-monthly-avg.xml"
+LOCAL_CURRENCY = "ron"
+
+# failures of a download, including those surfacing while the body is streamed and parsed
+FEED_ERRORS = (
+    requests.RequestException,
+    urllib3.exceptions.HTTPError,
+    ET.ParseError,
+    ValueError,
+    InvalidOperation,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RateStore:
+    """Rate effective on a date is the most recent one published up to that date"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def rate_on(self, currency: str, day: date, series=RateSeries.DAILY):
+        """Lei for one unit of currency, None when nothing was published yet"""
+        if currency == LOCAL_CURRENCY:
+            return Decimal(1)
+
+        self.ensure_loaded()
+        # single index seek on (series, currency, date)
+        return (
+            ExchangeRate.objects.filter(series=series, currency=currency, date__lte=day)
+            .order_by("-date")
+            .values_list("rate", flat=True)
+            .first()
+        )
+
+    def month_rate(self, currency: str, month: date):
+        """Monthly average when published, otherwise the daily rate effective at month end"""
+        if currency == LOCAL_CURRENCY:
+            return Decimal(1)
+
+        self.ensure_loaded()
+        month = month.replace(day=1)
+        average = ExchangeRate.objects.filter(
+            series=RateSeries.MONTHLY, currency=currency, date=month
+        ).values_list("rate", flat=True)
+        if rate := average.first():
+            return rate
+
+        month_end = month + relativedelta(months=1) - timedelta(days=1)
+        return self.rate_on(currency, min(month_end, date.today()))
+
+    def conversion(self, from_currency: str, to_currency: str, day: date):
+        """Units of to_currency for one unit of from_currency"""
+        from_rate = self.rate_on(from_currency, day)
+        to_rate = self.rate_on(to_currency, day)
+        if not (from_rate and to_rate):
+            return None
+        return (from_rate / to_rate).quantize(Decimal("0.0001"))
+
+    def ensure_loaded(self):
+        """Seeds the bundled monthly averages once, downloads are left to refresh_rates"""
+        if self._loaded:
+            return
+
+        with self._lock:
+            if not self._loaded:
+                if not ExchangeRate.objects.filter(series=RateSeries.MONTHLY).exists():
+                    store_rates(RateSeries.MONTHLY, iter_monthly_averages(MONTHLY_AVERAGE_XML))
+                self._loaded = True
+
+
+class RateRefresher(threading.Thread):
+    """Runs refresh_rates periodically, from within the web process"""
+
+    def __init__(self, interval):
+        super().__init__(name="bnr-refresh", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                refresh_rates()
+            except Exception:
+                logger.exception("BNR rates refresh failed")
+            finally:
+                connection.close()
+            self.stopped.wait(self.interval)
+
+
+def refresh_rates(today=None):
+    """Downloads the yearly BNR files still missing, returns stored rates and failed years"""
+    today = today or date.today()
+    stored, failed = 0, []
+    for year in missing_years(today):
+        try:
+            stored += update_from_feed(settings.BNR_YEARLY_URL.format(year=year)) or 0
+        except FEED_ERRORS as error:
+            logger.warning("BNR rates of %d not stored, fetch failed: %s", year, error)
+            failed.append(year)
+
+    return stored, failed
+
+
+def missing_years(today: date) -> list:
+    """Years from the first invoice on, except those downloaded in full after they ended"""
+    first_invoice = TimeInvoice.objects.order_by("issue_date").values_list("issue_date", flat=True)
+    # an invoice of early january takes the rate published late in december
+    first_year = ((first_invoice.first() or today) - timedelta(days=7)).year
+    urls = {
+        settings.BNR_YEARLY_URL.format(year=year): year
+        for year in range(first_year, today.year + 1)
+    }
+    downloads = RateFeed.objects.filter(url__in=urls).values_list("url", "checked_at")
+    complete = {
+        urls[url]
+        for url, checked_at in downloads
+        if timezone.localdate(checked_at) > date(urls[url], 12, 31)
+    }
+    return [year for year in urls.values() if year not in complete]
+
+
+def update_from_feed(url: str):
+    """Stores the daily rates of a feed, None when it did not change since the last download
+
+    Validators are kept only once every rate is stored, so a download cut short or a
+    malformed file is fetched again in full next time.
+    """
+    feed = RateFeed.objects.filter(url=url).first() or RateFeed(url=url)
+    response = fetch_feed(url, feed.etag, feed.last_modified)
+    if response is not None:
+        with response:
+            stored = store_rates(RateSeries.DAILY, iter_daily_rates(response.raw))
+        feed.etag = response.headers.get("ETag", "")
+        feed.last_modified = response.headers.get("Last-Modified", "")
+    else:
+        stored = None
+
+    feed.checked_at = timezone.now()
+    feed.save()
+    return stored
+
+
+def fetch_feed(url: str, etag="", last_modified=""):
+    """Conditional streaming download, None when content did not change since last time"""
+    headers = dict()
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = requests.get(url, headers=headers, timeout=settings.BNR_TIMEOUT, stream=True)
+    if response.status_code == 304:
+        response.close()
+        return None
+
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response
+
+
+def store_rates(series, rates, batch_size=1000) -> int:
+    """Upserts (date, currency, rate) tuples in batches, returns how many were stored"""
+    stored = 0
+    for batch in batched(rates, batch_size):
+        ExchangeRate.objects.bulk_create(
+            [
+                ExchangeRate(series=series, currency=currency, date=day, rate=rate)
+                for day, currency, rate in batch
+            ],
+            update_conflicts=True,
+            unique_fields=["series", "currency", "date"],
+            update_fields=["rate"],
+        )
+        stored += len(batch)
+
+    return stored
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+rate_store = RateStore()
+
+
+def start_refresher():
+    refresher = RateRefresher(settings.BNR_REFRESH_INTERVAL)
+    refresher.start()
+    return refresher
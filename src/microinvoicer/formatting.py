@@ -0,0 +1,93 @@
+"""Money and month names by buyer country, without touching the process wide locale"""
+from datetime import date
+from typing import NamedTuple
+
+
+class CountryFormat(NamedTuple):
+    """Monetary conventions of the glibc locale previously used for the country"""
+
+    currency_symbol: str
+    international_symbol: str
+    decimal_point: str
+    thousands_sep: str
+    symbol_precedes: bool
+    symbol_separated: bool
+    months: tuple
+
+    def currency(self, value, international=False) -> str:
+        """Same output as locale.currency(value, grouping=True, international=international)"""
+        whole, _, fraction = f"{abs(value):.2f}".partition(".")
+        groups = []
+        while len(whole) > 3:
+            groups.insert(0, whole[-3:])
+            whole = whole[:-3]
+        groups.insert(0, whole)
+        amount = self.thousands_sep.join(groups) + self.decimal_point + fraction
+
+        symbol = self.international_symbol if international else self.currency_symbol
+        space = " " if self.symbol_separated else ""
+        if self.symbol_precedes:
+            amount = symbol + space + amount
+        else:
+            amount = amount + space + symbol.rstrip(" ")
+        return f"-{amount}" if value < 0 else amount
+
+    def month_year(self, day: date) -> str:
+        """Same output as day.strftime("%B %Y")"""
+        return f"{self.months[day.month - 1]} {day.year}"
+
+
+# ro_RO
+ROMANIAN = CountryFormat(
+    currency_symbol="Lei",
+    international_symbol="RON ",
+    decimal_point=",",
+    thousands_sep=".",
+    symbol_precedes=False,
+    symbol_separated=True,
+    months=(
+        "ianuarie",
+        "februarie",
+        "martie",
+        "aprilie",
+        "mai",
+        "iunie",
+        "iulie",
+        "august",
+        "septembrie",
+        "octombrie",
+        "noiembrie",
+        "decembrie",
+    ),
+)
+# en_IE
+IRISH = CountryFormat(
+    currency_symbol="€",
+    international_symbol="EUR ",
+    decimal_point=".",
+    thousands_sep=",",
+    symbol_precedes=True,
+    symbol_separated=False,
+    months=(
+        "January",
+        "February",
+        "March",
+        "April",
+        "May",
+        "June",
+        "July",
+        "August",
+        "September",
+        "October",
+        "November",
+        "December",
+    ),
+)
+COUNTRY_FORMATS = {"RO": ROMANIAN, "CH": IRISH, "IE": IRISH, "NL": IRISH}
+
+
+def country_format(country: str) -> CountryFormat:
+    try:
+        return COUNTRY_FORMATS[country]
+    except KeyError:
+        raise RuntimeError(f"Locale settings not defined for {country}") from None
@@ -87,3 +87,7 @@ class TimeInvoiceForm(forms.ModelForm):
         registry = kwargs.pop("registry")
         super().__init__(*args, **kwargs)
         self.fields["contract"].queryset = models.ServiceContract.objects.filter(registry=registry)
+
+
+class InvoiceImportForm(forms.Form):
+    history = forms.FileField(help_text="csv with a header row, or json lines (.jsonl)")
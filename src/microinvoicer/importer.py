@@ -0,0 +1,249 @@
+"""Bulk import of invoicing history, one row per invoice with its buyer and contract"""
+import csv
+import io
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from . import rollups
+from .exchange_rates import batched, rate_store
+from .models import FiscalEntity, InvoiceStatus, MicroRegistry, ServiceContract, TimeInvoice
+
+
+# column name -> model field, columns missing from a file take the field default
+BUYER_COLUMNS = {
+    "buyer_name": "name",
+    "buyer_owner_fullname": "owner_fullname",
+    "buyer_registration_id": "registration_id",
+    "buyer_fiscal_code": "fiscal_code",
+    "buyer_address": "address",
+    "buyer_country": "country",
+    "buyer_bank_account": "bank_account",
+    "buyer_bank_name": "bank_name",
+}
+CONTRACT_COLUMNS = {
+    "contract_no": "registration_no",
+    "contract_date": "registration_date",
+    "contract_currency": "currency",
+    "contract_unit": "unit",
+    "contract_unit_rate": "unit_rate",
+    "contract_invoicing_currency": "invoicing_currency",
+    "contract_description": "invoicing_description",
+}
+INVOICE_COLUMNS = {
+    name: name
+    for name in [
+        "number",
+        "issue_date",
+        "quantity",
+        "status",
+        "description",
+        "conversion_rate",
+        "include_vat",
+        "attached_description",
+        "attached_cost",
+    ]
+}
+REQUIRED_COLUMNS = {"buyer_name", "buyer_fiscal_code", "contract_no", "issue_date", "quantity"}
+
+ImportResult = namedtuple("ImportResult", "buyers contracts invoices next_invoice_no")
+
+
+class ImportRowError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+
+
+def read_rows(stream, format_name):
+    """Yields (line, row dict) from a csv or jsonl stream, text or binary"""
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if format_name == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format_name == "jsonl":
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except json.JSONDecodeError as error:
+                raise ImportRowError(line, f"invalid json, {error.msg}") from None
+            if not isinstance(row, dict):
+                raise ImportRowError(line, f"expected an object, got {type(row).__name__}")
+            yield line, row
+    else:
+        raise ValueError(f"Unsupported import format '{format_name}'")
+
+
+def format_of(filename: str) -> str:
+    return "jsonl" if filename.lower().endswith((".jsonl", ".json")) else "csv"
+
+
+class InvoiceImporter:
+    """Validates rows and writes them with bulk inserts, a chunk at a time
+
+    Buyers are matched by fiscal code and contracts by buyer and contract number, the first
+    row mentioning a new one defines it. Invoices without a number get the next free one.
+    """
+
+    def __init__(self, registry: MicroRegistry, batch_size=2000):
+        self.registry = registry
+        self.batch_size = batch_size
+        contracts = registry.contracts.select_related("buyer")
+        self.contracts = {
+            (contract.buyer.fiscal_code, contract.registration_no): contract
+            for contract in contracts
+        }
+        self.buyers = {contract.buyer.fiscal_code: contract.buyer for contract in contracts}
+        self.contract_keys = set(self.contracts)
+        self.conversions = dict()
+        self.created = dict(buyers=0, contracts=0, invoices=0)
+
+    def run(self, rows) -> ImportResult:
+        """All or nothing, rows are validated and their conversion rates looked up first
+
+        Only the writes run in the transaction, which keeps the registry row locked.
+        """
+        cleaned = [(line, *self._clean(line, row)) for line, row in rows]
+        self._resolve_conversions(cleaned)
+
+        with transaction.atomic():
+            registry = MicroRegistry.objects.select_for_update().get(pk=self.registry.pk)
+            self.next_number = registry.next_invoice_no
+            used = registry.invoices.filter(series=registry.invoice_series)
+            self.numbers = set(used.values_list("number", flat=True))
+            for batch in batched(cleaned, self.batch_size):
+                self._import(batch)
+
+            if self.numbers:
+                MicroRegistry.objects.filter(pk=registry.pk).update(
+                    next_invoice_no=Greatest(F("next_invoice_no"), max(self.numbers) + 1)
+                )
+            rollups.rebuild(registries=[registry.pk])
+
+        self.registry.refresh_from_db(fields=["next_invoice_no"])
+        return ImportResult(**self.created, next_invoice_no=self.registry.next_invoice_no)
+
+    def _import(self, batch):
+        for line, _, _, invoice_data in batch:
+            self._number(line, invoice_data)
+
+        buyers = dict()
+        for _, buyer_data, _, _ in batch:
+            code = buyer_data["fiscal_code"]
+            if code not in self.buyers and code not in buyers:
+                buyers[code] = FiscalEntity(**buyer_data)
+        FiscalEntity.objects.bulk_create(buyers.values())
+        self.buyers.update(buyers)
+
+        contracts = dict()
+        for _, buyer_data, contract_data, _ in batch:
+            key = (buyer_data["fiscal_code"], contract_data["registration_no"])
+            if key not in self.contracts and key not in contracts:
+                contracts[key] = ServiceContract(
+                    registry=self.registry, buyer=self.buyers[key[0]], **contract_data
+                )
+        ServiceContract.objects.bulk_create(contracts.values())
+        self.contracts.update(contracts)
+
+        invoices = [
+            self._invoice(self.contracts[buyer["fiscal_code"], contract["registration_no"]], data)
+            for _, buyer, contract, data in batch
+        ]
+        TimeInvoice.objects.bulk_create(invoices)
+
+        self.created["buyers"] += len(buyers)
+        self.created["contracts"] += len(contracts)
+        self.created["invoices"] += len(invoices)
+
+    def _clean(self, line, row):
+        missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+        if missing:
+            raise ImportRowError(line, f"missing {', '.join(sorted(missing))}")
+
+        buyer = clean_fields(FiscalEntity, BUYER_COLUMNS, row, line)
+        contract = clean_fields(ServiceContract, CONTRACT_COLUMNS, row, line)
+        invoice = clean_fields(TimeInvoice, INVOICE_COLUMNS, row, line)
+
+        key = (buyer["fiscal_code"], contract["registration_no"])
+        if key not in self.contract_keys:
+            absent = set(CONTRACT_COLUMNS.values()) - set(contract) - {"invoicing_description"}
+            if absent:
+                raise ImportRowError(line, f"new contract misses {', '.join(sorted(absent))}")
+            self.contract_keys.add(key)
+        return buyer, contract, invoice
+
+    def _number(self, line, invoice):
+        number = invoice.setdefault("number", self.next_number)
+        if number in self.numbers:
+            raise ImportRowError(line, f"invoice number {number} is already used")
+        self.numbers.add(number)
+        self.next_number = max(self.next_number, number + 1)
+
+    def _resolve_conversions(self, cleaned):
+        """Rates of every currency, day pair the invoices need, before anything is written"""
+        currencies = {
+            key: (contract.currency, contract.invoicing_currency)
+            for key, contract in self.contracts.items()
+        }
+        for line, buyer, contract, invoice in cleaned:
+            key = (buyer["fiscal_code"], contract["registration_no"])
+            if key not in currencies:
+                # first row of a new contract, which then has all its columns
+                currencies[key] = (contract["currency"], contract["invoicing_currency"])
+            pair = currencies[key]
+            if invoice.get("conversion_rate") or pair[0] == pair[1]:
+                continue
+
+            conversion = (*pair, invoice["issue_date"])
+            if conversion not in self.conversions:
+                self.conversions[conversion] = rate_store.conversion(*conversion)
+            if self.conversions[conversion] is None:
+                source, target, day = conversion
+                raise ImportRowError(line, f"no BNR rate converting {source} to {target} on {day}")
+
+    def _invoice(self, contract, data) -> TimeInvoice:
+        """Missing details come from the contract and registry, like issuing from the form"""
+        invoice = TimeInvoice(
+            registry=self.registry,
+            seller_id=self.registry.seller_id,
+            buyer=contract.buyer,
+            contract=contract,
+            series=self.registry.invoice_series,
+            status=InvoiceStatus.PUBLISHED,
+            currency=contract.invoicing_currency,
+            unit=contract.unit,
+            unit_rate=contract.unit_rate,
+            include_vat=self.registry.include_vat,
+            description=contract.invoicing_description,
+        )
+        if not (data.get("attached_description") and data.get("attached_cost")):
+            data.pop("attached_description", None)
+            data.pop("attached_cost", None)
+        for name, value in data.items():
+            setattr(invoice, name, value)
+
+        if not invoice.conversion_rate and contract.currency != contract.invoicing_currency:
+            key = (contract.currency, contract.invoicing_currency, invoice.issue_date)
+            invoice.conversion_rate = self.conversions[key]
+        return invoice
+
+
+def clean_fields(model, columns, row, line) -> dict:
+    """Model field validation of the present columns, blank values count as absent"""
+    data = dict()
+    for column, name in columns.items():
+        value = row.get(column)
+        if value is None or value == "":
+            continue
+        try:
+            data[name] = model._meta.get_field(name).clean(value, None)
+        except ValidationError as error:
+            raise ImportRowError(line, f"{column} {'; '.join(error.messages)}") from None
+    return data
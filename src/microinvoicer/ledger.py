@@ -0,0 +1,131 @@
+"""Invoice ledger for accounting, streamed as csv one row per invoice"""
+import csv
+from datetime import date
+
+from . import bulk_export, models
+
+COLUMNS = [
+    "registry",
+    "invoice",
+    "issue_date",
+    "status",
+    "seller",
+    "seller_fiscal_code",
+    "buyer",
+    "buyer_fiscal_code",
+    "buyer_country",
+    "contract_no",
+    "description",
+    "quantity",
+    "unit",
+    "unit_rate",
+    "contract_currency",
+    "conversion_rate",
+    "currency",
+    "time_value",
+    "vat_percent",
+    "vat_value",
+    "attached_description",
+    "attached_cost",
+    "total",
+]
+# loaded fields, the related rows are wide and only a few of their columns are exported
+INVOICE_FIELDS = [
+    "registry__display_name",
+    "seller__name",
+    "seller__fiscal_code",
+    "buyer__name",
+    "buyer__fiscal_code",
+    "buyer__country",
+    "contract__registration_no",
+    "contract__currency",
+    "series",
+    "number",
+    "status",
+    "description",
+    "currency",
+    "conversion_rate",
+    "unit",
+    "unit_rate",
+    "attached_cost",
+    "attached_description",
+    "issue_date",
+    "quantity",
+    "include_vat",
+]
+STATUSES = {status.label.lower(): status.value for status in models.InvoiceStatus}
+
+
+def parse_filters(query):
+    """Optional quarter or since / until dates, and comma separated status names"""
+    if query.get("quarter"):
+        since, until = bulk_export.parse_period(quarter=query["quarter"])
+    else:
+        since, until = [
+            date.fromisoformat(query[name]) if query.get(name) else None
+            for name in ("since", "until")
+        ]
+
+    statuses = None
+    if query.get("status"):
+        names = [name.strip().lower() for name in query["status"].split(",")]
+        unknown = [name for name in names if name not in STATUSES]
+        if unknown:
+            raise ValueError(f"Unknown invoice status {', '.join(unknown)}")
+        statuses = [STATUSES[name] for name in names]
+    return since, until, statuses
+
+
+def ledger_invoices(invoices, since=None, until=None, statuses=None):
+    if since:
+        invoices = invoices.filter(issue_date__gte=since)
+    if until:
+        invoices = invoices.filter(issue_date__lte=until)
+    if statuses:
+        invoices = invoices.filter(status__in=statuses)
+    return (
+        invoices.select_related("registry", "seller", "buyer", "contract")
+        .only(*INVOICE_FIELDS)
+        .order_by("registry", "issue_date", "number")
+    )
+
+
+def ledger_row(invoice: models.TimeInvoice) -> list:
+    time_value = invoice.time_value()
+    vat_value = invoice.vat_value()
+    return [
+        invoice.registry.display_name,
+        invoice.series_number,
+        invoice.issue_date.isoformat(),
+        invoice.get_status_display(),
+        invoice.seller.name,
+        invoice.seller.fiscal_code,
+        invoice.buyer.name,
+        invoice.buyer.fiscal_code,
+        invoice.buyer.country.code,
+        invoice.contract.registration_no,
+        invoice.description,
+        invoice.quantity,
+        invoice.unit,
+        invoice.unit_rate,
+        invoice.contract.currency,
+        invoice.conversion_rate or "",
+        invoice.currency,
+        f"{time_value:.2f}",
+        invoice.include_vat,
+        f"{vat_value:.2f}",
+        invoice.attached_description or "",
+        invoice.attached_cost or "",
+        f"{time_value + vat_value + (invoice.attached_cost or 0):.2f}",
+    ]
+
+
+def ledger_lines(invoices, chunk_size=2000):
+    """Yields csv lines, holding no more than a chunk of invoices at once"""
+    stream = bulk_export.StreamBuffer()
+    writer = csv.writer(stream)
+    writer.writerow(COLUMNS)
+    yield stream.drain()
+    for invoice in invoices.iterator(chunk_size=chunk_size):
+        writer.writerow(ledger_row(invoice))
+        yield stream.drain()
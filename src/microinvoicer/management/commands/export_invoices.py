@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from microinvoicer import bulk_export, models
+
+
+class Command(BaseCommand):
+    help = "Renders all invoices of a registry and period into a zip archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("registry_id", type=int)
+        parser.add_argument("--quarter", help="for example 2024Q1")
+        parser.add_argument("--since", help="first issue date, YYYY-MM-DD")
+        parser.add_argument("--until", help="last issue date, YYYY-MM-DD")
+        parser.add_argument("--workers", type=int, help="rendering processes")
+        parser.add_argument("--output", help="archive path, named after the period by default")
+
+    def handle(self, *args, **options):
+        try:
+            registry = models.MicroRegistry.objects.get(pk=options["registry_id"])
+            since, until = bulk_export.parse_period(
+                options["quarter"], options["since"], options["until"]
+            )
+        except (models.MicroRegistry.DoesNotExist, ValueError) as error:
+            raise CommandError(error)
+
+        output = options["output"] or bulk_export.archive_name(registry, since, until)
+        invoices = bulk_export.period_invoices(registry, since, until)
+        documents = bulk_export.render_invoices(invoices, workers=options["workers"])
+        with open(output, "wb") as archive:
+            for chunk in bulk_export.zip_documents(documents):
+                archive.write(chunk)
+
+        self.stdout.write(f"Exported {invoices.count()} invoices into {output}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from microinvoicer import bulk_export, models, saft
+
+
+class Command(BaseCommand):
+    help = "Writes the SAF-T (D406) sales report of a registry for a quarter or date range"
+
+    def add_arguments(self, parser):
+        parser.add_argument("registry_id", type=int)
+        parser.add_argument("output", help="path of the xml file")
+        parser.add_argument("--quarter", help="like 2024Q1")
+        parser.add_argument("--since", help="first day, ISO format")
+        parser.add_argument("--until", help="last day, ISO format")
+
+    def handle(self, *args, **options):
+        try:
+            registry = models.MicroRegistry.objects.select_related("seller").get(
+                pk=options["registry_id"]
+            )
+            since, until = bulk_export.parse_period(
+                options["quarter"], options["since"], options["until"]
+            )
+            export = saft.D406Export(registry, since, until)
+            export.prepare()
+        except (models.MicroRegistry.DoesNotExist, ValueError) as error:
+            raise CommandError(error)
+
+        with open(options["output"], "wb") as output:
+            for chunk in export.chunks():
+                output.write(chunk)
+        self.stdout.write(f"Wrote {export.count} invoices from {since} to {until}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from microinvoicer import importer, models
+
+
+class Command(BaseCommand):
+    help = "Imports invoicing history of a registry, buyers and contracts included"
+
+    def add_arguments(self, parser):
+        parser.add_argument("registry_id", type=int)
+        parser.add_argument("path", help="csv with a header row, or json lines")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="guessed from extension")
+        parser.add_argument("--batch-size", type=int, default=2000, help="rows per insert")
+
+    def handle(self, *args, **options):
+        try:
+            registry = models.MicroRegistry.objects.get(pk=options["registry_id"])
+        except models.MicroRegistry.DoesNotExist as error:
+            raise CommandError(error)
+
+        format_name = options["format"] or importer.format_of(options["path"])
+        invoice_importer = importer.InvoiceImporter(registry, batch_size=options["batch_size"])
+        try:
+            with open(options["path"], "rb") as stream:
+                result = invoice_importer.run(importer.read_rows(stream, format_name))
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f"Imported {result.invoices} invoices, {result.contracts} new contracts and "
+            f"{result.buyers} new buyers, next invoice number is {result.next_invoice_no}"
+        )
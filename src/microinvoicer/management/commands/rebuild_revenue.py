@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from microinvoicer import rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the monthly revenue rollup from all invoices"
+
+    def handle(self, *args, **options):
+        created = rollups.rebuild()
+        self.stdout.write(f"Rebuilt {created} monthly revenue rows")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from microinvoicer import exchange_rates
+
+
+class Command(BaseCommand):
+    help = "Downloads the BNR daily rates missing from the database"
+
+    def handle(self, *args, **options):
+        stored, failed = exchange_rates.refresh_rates()
+        self.stdout.write(f"Stored {stored} exchange rates")
+        if failed:
+            raise CommandError(f"BNR download failed for {', '.join(map(str, failed))}")
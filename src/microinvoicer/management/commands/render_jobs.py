@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from microinvoicer import render_jobs
+
+
+class Command(BaseCommand):
+    help = "Works queued pdf rendering jobs, until stopped or once with --once"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+        parser.add_argument("--threads", type=int, default=1, help="concurrent jobs")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            render_jobs.requeue_stale()
+            done = render_jobs.work_queued()
+            self.stdout.write(f"Rendered {done} jobs")
+            return
+
+        self.stdout.write(f"Working render jobs with {options['threads']} threads")
+        workers = render_jobs.start_workers(options["threads"])
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.stopped.set()
+            for worker in workers:
+                worker.join(settings.PDF_RENDER_TIMEOUT)
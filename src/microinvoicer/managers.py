@@ -1,4 +1,9 @@
+from decimal import Decimal
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 
@@ -30,3 +35,31 @@ class MicroUserManager(BaseUserManager):
 
     def create_superuser(self, email, password, **extra_fields):
         return self._create_user(email, password, True, True, **extra_fields)
+
+
+def invoice_value_expression():
+    """Database side TimeInvoice.value, multiplications only so SQLite can't floor divide"""
+    time_value = F("unit_rate") * F("quantity") * Coalesce("conversion_rate", Value(Decimal(1)))
+    with_vat = time_value * (Value(100) + F("include_vat")) * Value(Decimal("0.01"))
+    return ExpressionWrapper(
+        with_vat + Coalesce("attached_cost", Value(Decimal(0))),
+        output_field=models.DecimalField(max_digits=24, decimal_places=4),
+    )
+
+
+class TimeInvoiceQuerySet(models.QuerySet):
+    def with_value(self):
+        """Annotates total_value, computed by the database"""
+        return self.annotate(total_value=invoice_value_expression())
+
+
+def related_count(queryset, field="registry"):
+    """Correlated subquery, counts rows of queryset pointing at the outer row"""
+    counts = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts), 0)
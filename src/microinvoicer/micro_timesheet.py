@@ -1,6 +1,7 @@
 """Module to create fake tasks"""
 import random
 from datetime import timedelta, date
+from functools import lru_cache
 
 
 FAKE_TASKS_POOL = [
@@ -45,14 +46,27 @@ FAKE_TASKS_POOL = [
 ]
 
 
-def fake_timesheet(hours, flavor, project_id, start_date):
+def fake_timesheet(hours, flavor, project_id, start_date, seed=None):
+    """Same seed, same timesheet"""
+    rng = random.Random(seed)
     timesheet = dict(start_date=start_date, flavor=flavor, project_id=project_id)
-    how_many = random.randrange(8, stop=18)
-    timesheet["tasks"] = create_random_tasks(timesheet, how_many, hours=hours)
+    how_many = rng.randrange(8, stop=18)
+    timesheet["tasks"] = create_random_tasks(timesheet, how_many, hours=hours, rng=rng)
 
     return timesheet
 
 
+def invoice_timesheet(invoice, flavor="Dashboard", project_id="Web Application"):
+    """Timesheet of the invoiced quantity, seeded by the invoice so it never changes"""
+    if "last_month" in invoice.contract.invoicing_description:
+        start_date = invoice.issue_date.replace(day=1) - timedelta(days=1)
+        start_date = start_date.replace(day=1)
+    else:
+        start_date = invoice.issue_date.replace(day=1)
+    seed = f"{invoice.registry_id}:{invoice.series}:{invoice.number}"
+    return fake_timesheet(invoice.quantity, flavor, project_id, start_date, seed=seed)
+
+
 def previous_month():
     today = date.today()
     last_month = today.replace(day=1) - timedelta(days=1)
@@ -60,12 +74,11 @@ def previous_month():
     return last_month
 
 
-def create_random_tasks(activity, how_many, hours):
-
-    names = pick_task_names(flavor=activity["flavor"], count=how_many)
-    durations = split_duration(duration=hours, count=how_many)
+def create_random_tasks(activity, how_many, hours, rng=random):
+    durations = split_duration(duration=hours, count=how_many, rng=rng)
+    names = pick_task_names(flavor=activity["flavor"], count=len(durations), rng=rng)
     dates = compute_start_dates(activity["start_date"], durations)
-    projects = [activity["project_id"]] * how_many
+    projects = [activity["project_id"]] * len(durations)
 
     tasks = [
         dict(name=name, date=date, duration=duration, project=project)
@@ -75,26 +88,30 @@ def create_random_tasks(activity, how_many, hours):
     return tasks
 
 
-def pick_task_names(flavor, count):
-    tasks = [
-        name.format(flavor=flavor).capitalize() for name in random.sample(FAKE_TASKS_POOL, k=count)
-    ]
-    return tasks
+@lru_cache(maxsize=None)
+def task_names(flavor):
+    return tuple(name.format(flavor=flavor).capitalize() for name in FAKE_TASKS_POOL)
+
+
+def pick_task_names(flavor, count, rng=random):
+    return rng.sample(task_names(flavor), k=count)
 
 
-def split_duration(duration, count):
-    left = duration
-    splits = []
-    step = 1
+def split_duration(duration, count, rng=random):
+    """Up to count whole durations adding up to duration, at least one hour each
 
-    for step in range(count - 1):
-        max_split = round(left * (0.618 * (step + 2) / count))
-        min_split = min(4, max_split - 1)
-        current_split = random.randrange(min_split, stop=max_split)
-        splits.append(current_split)
-        left -= current_split
+    Every split gets up to 4 hours upfront, what is left goes by random weights and the
+    rounding remainder, less than an hour per split, to the first ones.
+    """
+    count = max(1, min(count, duration))
+    base = min(4, duration // count)
+    left = duration - base * count
 
-    splits.append(left)
+    weights = [rng.random() + 0.25 for _ in range(count)]
+    total = sum(weights)
+    splits = [base + int(left * weight / total) for weight in weights]
+    for index in range(duration - sum(splits)):
+        splits[index] += 1
 
     return splits
 
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microinvoicer', '0032_alter_microregistry_include_vat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(choices=[('d', 'Daily'), ('m', 'Monthly average')], max_length=1)),
+                ('currency', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('series', 'currency', 'date'), name='unique_exchange_rate')],
+            },
+        ),
+    ]
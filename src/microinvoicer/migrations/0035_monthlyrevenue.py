@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microinvoicer', '0034_ratefeed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRevenue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('currency', models.CharField(choices=[('eur', 'Euros'), ('usd', 'US Dollars'), ('ron', 'Lei')], max_length=3)),
+                ('total', models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ('count', models.IntegerField(default=0)),
+                ('registry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenues', to='microinvoicer.microregistry')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('registry', 'year', 'month', 'currency'), name='unique_monthly_revenue')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+from django.db import migrations
+from django.db.migrations.operations.special import RunPython
+
+
+STORNO = 2
+
+
+def fill_monthly_revenue(apps, schema_editor):
+    TimeInvoice = apps.get_model("microinvoicer", "TimeInvoice")
+    MonthlyRevenue = apps.get_model("microinvoicer", "MonthlyRevenue")
+    rollup = dict()
+    for invoice in TimeInvoice.objects.exclude(status=STORNO).iterator():
+        key = (invoice.registry_id, invoice.issue_date.year, invoice.issue_date.month, invoice.currency)
+        time_value = invoice.unit_rate * invoice.quantity * (invoice.conversion_rate or 1)
+        value = time_value * (100 + invoice.include_vat) / 100 + (invoice.attached_cost or 0)
+        total, count = rollup.get(key, (0, 0))
+        rollup[key] = (total + value, count + 1)
+
+    MonthlyRevenue.objects.bulk_create(
+        MonthlyRevenue(
+            registry_id=registry_id, year=year, month=month, currency=currency, total=total, count=count
+        )
+        for (registry_id, year, month, currency), (total, count) in rollup.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microinvoicer', '0035_monthlyrevenue'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_monthly_revenue, reverse_code=RunPython.noop),
+    ]
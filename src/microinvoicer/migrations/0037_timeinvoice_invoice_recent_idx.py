@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microinvoicer', '0036_fill_monthly_revenue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeinvoice',
+            index=models.Index(fields=['registry', '-issue_date', '-number'], name='invoice_recent_idx'),
+        ),
+    ]
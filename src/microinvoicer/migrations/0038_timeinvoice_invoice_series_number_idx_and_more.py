@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('microinvoicer', '0037_timeinvoice_invoice_recent_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeinvoice',
+            index=models.Index(fields=['series', 'number'], name='invoice_series_number_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeinvoice',
+            constraint=models.UniqueConstraint(fields=('registry', 'series', 'number'), name='unique_invoice_number'),
+        ),
+    ]
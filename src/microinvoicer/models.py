@@ -1,13 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.core.mail import send_mail
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.utils import timezone
 from django_countries.fields import CountryField
-from datetime import date
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
 
-from .managers import MicroUserManager
+from .managers import MicroUserManager, TimeInvoiceQuerySet
 
 
 LONG_TEXT = 255
@@ -19,6 +21,15 @@ def quarter_of(a_date: date):
     return f"Q{1 + (a_date.month - 1) // 3}"
 
 
+def quarter_bounds(year: int, quarter: str):
+    """First and last day of a quarter, as named by quarter_of"""
+    if quarter not in {"Q1", "Q2", "Q3", "Q4"}:
+        raise ValueError(f"Unknown quarter {quarter}")
+    since = date(year, 1 + 3 * (int(quarter[1]) - 1), 1)
+    until = since + relativedelta(months=3) - timedelta(days=1)
+    return since, until
+
+
 class AvailableCurrencies(models.TextChoices):
     EUR = "eur", "Euros"
     USD = "usd", "US Dollars"
@@ -37,6 +48,26 @@ class InvoiceStatus(models.IntegerChoices):
     STORNO = 2, "Storno"
 
 
+class RateSeries(models.TextChoices):
+    DAILY = "d", "Daily"
+    MONTHLY = "m", "Monthly average"
+
+
+class RenderKind(models.TextChoices):
+    INVOICE = "invoice", "Invoice"
+    TIMESHEET = "timesheet", "Timesheet"
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+ACTIVE_JOB_STATUSES = [JobStatus.QUEUED, JobStatus.RUNNING]
+
+
 class FiscalEntity(models.Model):
     name = models.CharField(max_length=LONG_TEXT)
     owner_fullname = models.CharField(max_length=LONG_TEXT)
@@ -96,6 +127,21 @@ class MicroRegistry(models.Model):
         ),
     )
 
+    def allocate_invoice_no(self) -> int:
+        """Reserves the next number, must run inside the transaction saving the invoice"""
+        # the update locks the registry row until commit, concurrent allocations queue up
+        MicroRegistry.objects.filter(pk=self.pk).update(next_invoice_no=F("next_invoice_no") + 1)
+        self.refresh_from_db(fields=["next_invoice_no"])
+        return self.next_invoice_no - 1
+
+    def release_invoice_no(self, number: int) -> bool:
+        """Takes back a number, only when no other was allocated after it"""
+        released = MicroRegistry.objects.filter(pk=self.pk, next_invoice_no=number + 1).update(
+            next_invoice_no=F("next_invoice_no") - 1
+        )
+        self.refresh_from_db(fields=["next_invoice_no"])
+        return bool(released)
+
     def __repr__(self) -> str:
         return f"{self.display_name}, series {self.invoice_series}, {self.contracts.count()} contracts and ..."
 
@@ -148,6 +194,26 @@ class TimeInvoice(models.Model):
     quantity = models.IntegerField()
     include_vat = models.IntegerField(default=0)
 
+    objects = TimeInvoiceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination, most recent first
+            models.Index(fields=["registry", "-issue_date", "-number"], name="invoice_recent_idx"),
+            # lookup by invoice number alone, across registries
+            models.Index(fields=["series", "number"], name="invoice_series_number_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["registry", "series", "number"], name="unique_invoice_number"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Atomic, so the revenue rollup kept by signal receivers commits along"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     @property
     def series_number(self):
         return f"{self.series}-{self.number:04}"
@@ -172,3 +238,105 @@ class TimeInvoice(models.Model):
 
     def __str__(self):
         return repr(self)
+
+
+class MonthlyRevenue(models.Model):
+    """Rollup of non storno invoices, by issue month and invoicing currency"""
+
+    registry = models.ForeignKey(MicroRegistry, related_name="revenues", on_delete=models.CASCADE)
+    year = models.IntegerField()
+    month = models.IntegerField()
+    currency = models.CharField(max_length=3, choices=AvailableCurrencies.choices)
+    total = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["registry", "year", "month", "currency"], name="unique_monthly_revenue"
+            ),
+        ]
+
+    def __repr__(self) -> str:
+        return f"{self.year}-{self.month:02}, {self.count} invoices, {self.total} {self.currency}"
+
+    def __str__(self):
+        return repr(self)
+
+
+class ExchangeRate(models.Model):
+    """BNR reference rate, lei for one unit of currency"""
+
+    series = models.CharField(max_length=1, choices=RateSeries.choices)
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=16, decimal_places=6)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["series", "currency", "date"], name="unique_exchange_rate"
+            ),
+        ]
+
+    def __repr__(self) -> str:
+        return f"{self.currency} {self.rate} on {self.date} ({self.get_series_display()})"
+
+    def __str__(self):
+        return repr(self)
+
+
+class RateFeed(models.Model):
+    """Validators of the last download, for conditional requests"""
+
+    url = models.URLField(unique=True)
+    etag = models.CharField(max_length=LONG_TEXT, blank=True)
+    last_modified = models.CharField(max_length=SHORT_TEXT, blank=True)
+    checked_at = models.DateTimeField(default=timezone.now)
+
+    def __repr__(self) -> str:
+        return f"{self.url} checked at {self.checked_at}"
+
+    def __str__(self):
+        return repr(self)
+
+
+class RenderJob(models.Model):
+    """Pdf rendering requested by a web worker, picked up by the render_jobs worker"""
+
+    kind = models.CharField(max_length=SHORT_TEXT, choices=RenderKind.choices)
+    invoice = models.ForeignKey(TimeInvoice, related_name="render_jobs", on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=SHORT_TEXT, choices=JobStatus.choices, default=JobStatus.QUEUED
+    )
+    content = models.BinaryField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"], name="render_job_queue_idx")]
+        constraints = [
+            # identical requests share the job in progress
+            models.UniqueConstraint(
+                fields=["kind", "invoice"],
+                condition=models.Q(status__in=ACTIVE_JOB_STATUSES),
+                name="unique_active_render_job",
+            ),
+        ]
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ACTIVE_JOB_STATUSES
+
+    @property
+    def filename(self) -> str:
+        suffix = "-timesheet" if self.kind == RenderKind.TIMESHEET else ""
+        return f"{self.invoice.series_number}{suffix}.pdf"
+
+    def __repr__(self) -> str:
+        return f"{self.get_kind_display()} of invoice {self.invoice_id}, {self.status}"
+
+    def __str__(self):
+        return repr(self)
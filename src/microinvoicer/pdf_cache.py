@@ -0,0 +1,86 @@
+"""Content addressed, size bounded, on-disk cache for generated pdf documents"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+
+def content_key(template_name: str, context: dict, renderer: str) -> str:
+    """Hash of the rendering context, template version and renderer version"""
+    template = get_template(template_name)
+    mtime = os.stat(template.origin.name).st_mtime_ns
+    payload = json.dumps(context, sort_keys=True, default=str)
+
+    digest = hashlib.sha256(f"{renderer}:{template_name}:{mtime}:".encode())
+    digest.update(payload.encode())
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """Keeps one folder per invoice, evicts least recently used files over max_bytes"""
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        # bytes on disk as of the last scan plus what this process wrote since, others may add
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, invoice_id, key) -> Path:
+        return self.root / str(invoice_id) / f"{key}.pdf"
+
+    def get(self, invoice_id, key):
+        path = self.path(invoice_id, key)
+        try:
+            content = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        # file mtime doubles as last access time
+        os.utime(path)
+        return content
+
+    def put(self, invoice_id, key, content: bytes):
+        path = self.path(invoice_id, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # unique name, concurrent writers of the same key never share a temporary file
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as temp:
+            temp.write(content)
+        os.replace(temp.name, path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(content)
+            if self._size is None or self._size > self.max_bytes:
+                self._size = self.evict()
+
+    def invalidate(self, *invoice_ids):
+        for invoice_id in invoice_ids:
+            shutil.rmtree(self.root / str(invoice_id), ignore_errors=True)
+
+    def evict(self) -> int:
+        """Drops least recently used files until under max_bytes, returns the size left"""
+        entries = []
+        for path in self.root.glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+        return total_size
+
+
+invoice_cache = PdfCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
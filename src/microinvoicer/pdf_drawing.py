@@ -0,0 +1,250 @@
+"""Draws invoice and timesheet pdfs straight from rendering contexts, with reportlab"""
+import io
+import os
+from xml.sax.saxutils import escape
+
+from django.utils import dateformat, formats
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# first pair found wins, the pdf templates use Open Sans with DejaVu Sans as fallback
+FONT_CANDIDATES = [
+    (
+        "/usr/share/fonts/truetype/open-sans/OpenSans-Regular.ttf",
+        "/usr/share/fonts/truetype/open-sans/OpenSans-Bold.ttf",
+    ),
+    (
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    ),
+]
+# sizes of the html templates, scaled like wkhtmltopdf shrinks them to fit A4
+BODY_SIZE = 9.5
+ITEMS_SIZE = 9.5
+TITLE_SIZE = 14
+NOTE_SIZE = 9
+SIGNATURES_SIZE = 11
+FOOTER = "..: micro-tools.fibonet.ro :.."
+MARGINS = dict(topMargin=9 * mm, rightMargin=9 * mm, bottomMargin=9 * mm, leftMargin=18 * mm)
+
+
+def register_fonts():
+    """Unicode TrueType fonts for romanian diacritics, Helvetica when none is installed"""
+    for regular, bold in FONT_CANDIDATES:
+        if os.path.exists(regular) and os.path.exists(bold):
+            pdfmetrics.registerFont(TTFont("Invoice", regular))
+            pdfmetrics.registerFont(TTFont("Invoice-Bold", bold))
+            return "Invoice", "Invoice-Bold"
+    return "Helvetica", "Helvetica-Bold"
+
+
+FONT, BOLD_FONT = register_fonts()
+
+
+def style(size=BODY_SIZE, alignment=TA_LEFT, bold=False, color=colors.black, leading=None):
+    return ParagraphStyle(
+        name=f"{size}-{alignment}-{bold}",
+        fontName=BOLD_FONT if bold else FONT,
+        fontSize=size,
+        leading=leading or size * 1.3,
+        alignment=alignment,
+        textColor=color,
+    )
+
+
+def text(value, **style_options):
+    """Paragraph showing the value the way templates do, newlines break lines"""
+    if value is None:
+        value = ""
+    lines = escape(str(formats.localize(value))).replace("\n", "<br/>")
+    return Paragraph(lines, style(**style_options))
+
+
+def draw_invoice(tr_invoice: dict) -> bytes:
+    international = tr_invoice["international"]
+    items = [
+        ["No", "Description", "Qty", "Unit", "Price", "Amount"]
+        if international
+        else ["Nr.", "Descriere", "Cant.", "U.M.", "Preț unitar", "Valoare"]
+    ]
+    items[0].append(f"{'VAT' if international else 'TVA'} ({tr_invoice['invoice_vat_perc']})")
+    items.append(
+        [
+            "1",
+            tr_invoice["invoice_description"],
+            tr_invoice["invoice_quantity"],
+            tr_invoice["invoice_unit"],
+            tr_invoice["invoice_price"],
+            tr_invoice["invoice_time_value"],
+            tr_invoice["invoice_vat"],
+        ]
+    )
+    if tr_invoice["invoice_attached_description"]:
+        items.append(
+            [
+                "2",
+                tr_invoice["invoice_attached_description"],
+                "",
+                "",
+                "",
+                tr_invoice["invoice_attached_cost"],
+                "--",
+            ]
+        )
+    total_row = len(items)
+    total = f"Total {'due' if international else 'de plata'}"
+    items.append(["", "", "", total, "", tr_invoice["invoice_value"], ""])
+    conversion = ""
+    if tr_invoice["invoice_conversion_rate"]:
+        conversion = f"Curs BNR\n1 Euro = {tr_invoice['invoice_conversion_rate']:.4f} Lei"
+    items.append(["", conversion, "", "", "", "", ""])
+
+    widths = [0.05, None, 0.08, 0.08, 0.14, 0.14, 0.14]
+    table = items_table(items, widths, total_row)
+    table.setStyle(
+        TableStyle(
+            [
+                ("SPAN", (3, total_row), (4, total_row)),
+                ("SPAN", (5, total_row), (6, total_row)),
+                ("ALIGN", (3, total_row), (4, total_row), "RIGHT"),
+                ("TOPPADDING", (0, total_row + 1), (-1, total_row + 1), 10 * mm),
+            ]
+        )
+    )
+    if international:
+        note = (
+            "* VAT reverse charge (dir. 2008/8/EC)\n** non-taxable in Romania art. 268 (1)\n"
+            "and art. 278 (2) of Romanian Fiscal Code"
+        )
+    else:
+        note = (
+            "* prezenta factură circulă\nfără semnătură și ștampilă\n"
+            "cf. art. 319 (29) din Codul Fiscal"
+        )
+
+    story = header(tr_invoice) + [
+        table,
+        Spacer(0, 18 * mm),
+        text(note, size=NOTE_SIZE, alignment=TA_CENTER, color=colors.darkgray),
+    ]
+    return build(story, tr_invoice["invoice_title"])
+
+
+def draw_timesheet(tr_invoice: dict) -> bytes:
+    international = tr_invoice["international"]
+    items = [
+        ["Date", "Project", "Activity"] if international else ["Data", "Proiect", "Activitate"]
+    ]
+    items[0].append(tr_invoice["invoice_unit"])
+    for task in tr_invoice["tasks"]:
+        items.append([task["date"], task["project"], task["name"], task["duration"]])
+    total_row = len(items)
+    items.append(["", "", "Total", tr_invoice["invoice_quantity"]])
+
+    table = items_table(items, [0.18, 0.18, None, 0.14], total_row)
+    table.setStyle(TableStyle([("ALIGN", (2, total_row), (2, total_row), "RIGHT")]))
+
+    head = tr_invoice["head"]
+    rows = [
+        (head["left_first"], head["right_first"]),
+        ("", ""),
+        head["items"][0],
+        (tr_invoice["seller"].owner_fullname, tr_invoice["buyer"].owner_fullname),
+    ]
+    cells = [
+        [text(cell, size=SIGNATURES_SIZE, alignment=TA_CENTER, bold=index == 0) for cell in row]
+        for index, row in enumerate(rows)
+    ]
+    signatures = Table(cells, colWidths=[0.475 * content_width()] * 2)
+    story = header(tr_invoice) + [table, Spacer(0, 18 * mm), signatures]
+    return build(story, tr_invoice["invoice_title"])
+
+
+def header(tr_invoice: dict) -> list:
+    """Seller and buyer columns, followed by the title and the invoice number"""
+    head = tr_invoice["head"]
+    rows = [[text(head["left_first"]), text(head["right_first"], alignment=TA_RIGHT)]]
+    for index, (left, right) in enumerate(head["items"]):
+        bold = index == 0
+        rows.append([text(left, bold=bold), text(right, alignment=TA_RIGHT, bold=bold)])
+    parties = Table(rows, colWidths=[content_width() / 2] * 2)
+    parties.setStyle(TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")] + tight_padding()))
+
+    issue_date = dateformat.format(tr_invoice["invoice_issue_date"], "d-M-Y")
+    number = Table(
+        [
+            [
+                text(
+                    f"{tr_invoice['subtitle_no']}\n{tr_invoice['subtitle_from']}",
+                    size=TITLE_SIZE,
+                    alignment=TA_RIGHT,
+                ),
+                text(f"{tr_invoice['invoice_series_number']}\n{issue_date}", size=TITLE_SIZE),
+            ]
+        ],
+        colWidths=[content_width() / 2] * 2,
+    )
+    return [
+        parties,
+        Spacer(0, 12 * mm),
+        text(tr_invoice["invoice_title"], size=TITLE_SIZE * 1.5, alignment=TA_CENTER, bold=True),
+        Spacer(0, 2 * mm),
+        number,
+        Spacer(0, 12 * mm),
+    ]
+
+
+def items_table(items, widths, total_row) -> Table:
+    """Bold underlined captions, bold overlined total row"""
+    auto_width = content_width() * (1 - sum(width for width in widths if width))
+    column_widths = [content_width() * width if width else auto_width for width in widths]
+    rows = [
+        [
+            text(cell, size=ITEMS_SIZE, alignment=TA_CENTER, bold=index in (0, total_row))
+            for cell in row
+        ]
+        for index, row in enumerate(items)
+    ]
+    table = Table(rows, colWidths=column_widths, repeatRows=1)
+    table.setStyle(
+        TableStyle(
+            [
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("LEFTPADDING", (0, 0), (-1, -1), 2),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 2),
+                ("LINEBELOW", (0, 0), (-1, 0), 1, colors.black),
+                ("LINEABOVE", (0, total_row), (-1, total_row), 1, colors.black),
+                ("TOPPADDING", (0, total_row), (-1, total_row), 8),
+            ]
+        )
+    )
+    return table
+
+
+def build(story, title) -> bytes:
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(buffer, pagesize=A4, title=title, **MARGINS)
+    document.build(story, onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue()
+
+
+def footer(canvas, document):
+    canvas.saveState()
+    canvas.setFont("Courier", BODY_SIZE)
+    canvas.setFillColor(colors.darkgray)
+    canvas.drawRightString(A4[0] - document.rightMargin, document.bottomMargin, FOOTER)
+    canvas.restoreState()
+
+
+def content_width() -> float:
+    return A4[0] - MARGINS["leftMargin"] - MARGINS["rightMargin"]
+
+
+def tight_padding() -> list:
+    return [("TOPPADDING", (0, 0), (-1, -1), 1), ("BOTTOMPADDING", (0, 0), (-1, -1), 1)]
@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import locale
+import hashlib
 import io
+import json
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.template.loader import render_to_string
-import pdfkit
+from django.utils.translation import get_language
+from django_countries import countries
 
+from . import formatting, micro_timesheet
 from .models import TimeInvoice
+from .pdf_cache import content_key, invoice_cache
+from .render_engine import html_to_pdf, render_pool
 
 
 RENDER_OPTIONS = {
@@ -21,105 +31,230 @@ RENDER_OPTIONS = {
 }
 
 
-def render_timesheet(invoice: TimeInvoice, timesheet):
-    country = invoice.buyer.country
-    international = True
-    if country == "RO":
-        locale.setlocale(locale.LC_ALL, "ro_RO")
-        international = False
-    elif country in {"CH", "IE", "NL"}:
-        locale.setlocale(locale.LC_ALL, "en_IE")
-    else:
-        raise RuntimeError(f"Locale settings not defined for {country}")
+INVOICE_TEMPLATE = "pdf_time_invoice_template.html"
+TIMESHEET_TEMPLATE = "pdf_timesheet_template.html"
+UNIT_NAMES = {"mo": ("luni", "month(s)"), "hr": ("ore", "hour(s)"), "d": ("zile", "day(s)")}
 
-    tr_invoice = translate_invoice(invoice, international)
-    tr_invoice["seller"] = invoice.seller
-    tr_invoice["buyer"] = invoice.buyer
-    tr_invoice["tasks"] = timesheet["tasks"]
-    options = dict(RENDER_OPTIONS)
-    tr_invoice["invoice_title"] = options["title"] = (
-        "Annex: Timesheet Report" if international else "Anexa: Raport de Activitate"
-    )
-    html_content = render_to_string("pdf_timesheet_template.html", context=tr_invoice)
-    pdf_content = pdfkit.from_string(html_content, options=options)
+
+def render_timesheet(invoice: TimeInvoice, timesheet):
+    tr_invoice = timesheet_context(invoice, timesheet)
+    pdf_content = render_pdf(TIMESHEET_TEMPLATE, tr_invoice)
     buffer = io.BytesIO(pdf_content)
 
     return buffer
 
 
 def render_invoice(invoice: TimeInvoice):
-    country = invoice.buyer.country
-    international = True
-    if country == "RO":
-        locale.setlocale(locale.LC_ALL, "ro_RO")
-        international = False
-    elif country in {"CH", "IE", "NL"}:
-        locale.setlocale(locale.LC_ALL, "en_IE")
-    else:
-        raise RuntimeError(f"Locale settings not defined for {country}")
+    tr_invoice = invoice_context(invoice)
+    pdf_content = render_pdf(INVOICE_TEMPLATE, tr_invoice)
+    buffer = io.BytesIO(pdf_content)
 
-    tr_invoice = translate_invoice(invoice, international)
+    return buffer
+
+
+def invoice_pdf(invoice: TimeInvoice) -> bytes:
+    """Pdf content of the invoice, straight from cache when unchanged"""
+    tr_invoice = invoice_context(invoice)
+    key = document_key(INVOICE_TEMPLATE, tr_invoice)
+    content = invoice_cache.get(invoice.pk, key)
+    if content is None:
+        content = render_pdf(INVOICE_TEMPLATE, tr_invoice)
+        invoice_cache.put(invoice.pk, key, content)
+    return content
+
+
+def timesheet_pdf(invoice: TimeInvoice) -> bytes:
+    """Pdf content of a fake timesheet covering the invoiced quantity, cached like invoices"""
+    timesheet = micro_timesheet.invoice_timesheet(invoice)
+    tr_invoice = timesheet_context(invoice, timesheet)
+    key = document_key(TIMESHEET_TEMPLATE, tr_invoice)
+    content = invoice_cache.get(invoice.pk, key)
+    if content is None:
+        content = render_pdf(TIMESHEET_TEMPLATE, tr_invoice)
+        invoice_cache.put(invoice.pk, key, content)
+    return content
+
+
+def document_key(template_name: str, tr_invoice: dict) -> str:
+    """Cache key of a document, changes along with the configured backend or its version"""
+    return content_key(template_name, tr_invoice, pdf_backend().version)
+
+
+def render_pdf(template_name: str, tr_invoice: dict) -> bytes:
+    """Converts a translated invoice context into pdf content"""
+    return pdf_backend().render(template_name, tr_invoice)
+
+
+def render_document(template_name: str, tr_invoice: dict) -> bytes:
+    """Same as render_pdf but bypassing the renderer pool, for bulk export processes"""
+    return pdf_backend(pooled=False).render(template_name, tr_invoice)
+
+
+class WkhtmltopdfBackend:
+    """Html templates converted by a wkhtmltopdf subprocess"""
+
+    name = "wkhtmltopdf"
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.version = f"{self.name}:{digest(json.dumps(RENDER_OPTIONS, sort_keys=True))}"
+
+    def render(self, template_name: str, tr_invoice: dict) -> bytes:
+        html_content, options = render_html(template_name, tr_invoice)
+        if self.pool is None:
+            return html_to_pdf(html_content, options)
+        return self.pool.render(html_content, options)
+
+
+class ReportlabBackend:
+    """Layout drawn in process straight from the rendering context, html templates unused"""
+
+    name = "reportlab"
+
+    def __init__(self, pool=None):
+        try:
+            import reportlab
+
+            from . import pdf_drawing
+        except ImportError as error:
+            raise ImproperlyConfigured(f"The reportlab pdf backend is not available: {error}")
+
+        with open(pdf_drawing.__file__, encoding="utf-8") as source:
+            self.version = f"{self.name}:{reportlab.Version}:{digest(source.read())}"
+
+        self.drawers = {
+            INVOICE_TEMPLATE: pdf_drawing.draw_invoice,
+            TIMESHEET_TEMPLATE: pdf_drawing.draw_timesheet,
+        }
+
+    def render(self, template_name: str, tr_invoice: dict) -> bytes:
+        return self.drawers[template_name](tr_invoice)
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+PDF_BACKENDS = {backend.name: backend for backend in (WkhtmltopdfBackend, ReportlabBackend)}
+
+
+@lru_cache(maxsize=None)
+def pdf_backend(pooled=True):
+    """Backend picked by settings.PDF_BACKEND, sharing the renderer pool unless told not to"""
+    try:
+        backend_class = PDF_BACKENDS[settings.PDF_BACKEND]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown pdf backend '{settings.PDF_BACKEND}'") from None
+    return backend_class(pool=render_pool if pooled else None)
+
+
+def render_html(template_name: str, tr_invoice: dict):
+    """Returns html content and the matching wkhtmltopdf options"""
     options = dict(RENDER_OPTIONS)
     options["title"] = tr_invoice["invoice_title"]
-    html_content = render_to_string("pdf_time_invoice_template.html", context=tr_invoice)
-    pdf_content = pdfkit.from_string(html_content, options=options)
-    buffer = io.BytesIO(pdf_content)
+    html_content = render_to_string(template_name, context=tr_invoice)
+    return html_content, options
+
+
+def invoice_context(invoice: TimeInvoice) -> dict:
+    international = is_international(invoice)
+    return translate_invoice(invoice, international)
+
+
+def timesheet_context(invoice: TimeInvoice, timesheet) -> dict:
+    international = is_international(invoice)
+    tr_invoice = translate_invoice(invoice, international)
+    tr_invoice["seller"] = invoice.seller
+    tr_invoice["buyer"] = invoice.buyer
+    tr_invoice["tasks"] = timesheet["tasks"]
+    labels = labels_for(international, invoice.buyer.country.code)
+    tr_invoice["invoice_title"] = labels.timesheet_title
+    return tr_invoice
 
-    return buffer
+
+def is_international(invoice: TimeInvoice) -> bool:
+    """Only romanian buyers get invoices in romanian"""
+    formatting.country_format(invoice.buyer.country)
+    return invoice.buyer.country != "RO"
+
+
+class Labels(NamedTuple):
+    """Everything in a rendering context that depends only on language and buyer country"""
+
+    money: formatting.CountryFormat
+    titles: dict
+    header: dict
+    timesheet_title: str
+
+
+@lru_cache(maxsize=None)
+def labels_for(international: bool, country: str) -> Labels:
+    return Labels(
+        money=formatting.country_format(country),
+        titles=dict(
+            international=international,
+            invoice_title="INVOICE" if international else "FACTURA",
+            subtitle_no="no:" if international else "nr:",
+            subtitle_from="date:" if international else "din:",
+        ),
+        header=dict(
+            left_first="Supplier:" if international else "Furnizor:",
+            right_first="Buyer:" if international else "Beneficiar:",
+        ),
+        timesheet_title=(
+            "Annex: Timesheet Report" if international else "Anexa: Raport de Activitate"
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def country_name(code: str, language: str) -> str:
+    """django_countries looks the name up in its translated table on every access"""
+    return countries.name(code)
 
 
 def translate_invoice(invoice: TimeInvoice, international) -> dict:
+    labels = labels_for(international, invoice.buyer.country.code)
+    money = labels.money
     data = dict(
-        international=international,
+        labels.titles,
         head=create_header_data(invoice, international),
-        invoice_title="INVOICE" if international else "FACTURA",
         invoice_series_number=invoice.series_number,
         invoice_issue_date=invoice.issue_date,
-        subtitle_no="no:" if international else "nr:",
-        subtitle_from="date:" if international else "din:",
         invoice_description=invoice.description,
         invoice_quantity=invoice.quantity,
         invoice_unit=translate_units(invoice.unit, international),
         invoice_conversion_rate=invoice.conversion_rate,
-        invoice_price=locale.currency(
-            invoice.unit_rate * (invoice.conversion_rate or 1),
-            grouping=True,
-            international=international,
+        invoice_price=money.currency(
+            invoice.unit_rate * (invoice.conversion_rate or 1), international
         ),
         invoice_vat_perc=f"{invoice.include_vat}%",
-        invoice_vat=locale.currency(
-            invoice.vat_value(), grouping=True, international=international
-        ),
-        invoice_time_value=locale.currency(
-            invoice.time_value(), grouping=True, international=international
-        ),
+        invoice_vat=money.currency(invoice.vat_value(), international),
+        invoice_time_value=money.currency(invoice.time_value(), international),
         invoice_attached_description=invoice.attached_description,
-        invoice_attached_cost=locale.currency(
-            invoice.attached_cost or 0, grouping=True, international=international
-        ),
-        invoice_value=locale.currency(invoice.value, grouping=True, international=international),
+        invoice_attached_cost=money.currency(invoice.attached_cost or 0, international),
+        invoice_value=money.currency(invoice.value, international),
     )
 
     return data
 
 
 def translate_units(original, international):
-    translation = {"mo": ("luni", "month(s)"), "hr": ("ore", "hour(s)"), "d": ("zile", "day(s)")}
-    return translation.get(original, original)[international]
+    return UNIT_NAMES.get(original, original)[international]
 
 
 def create_header_data(invoice, international):
-    header = dict()
-    header["left_first"] = "Supplier:" if international else "Furnizor:"
-    header["right_first"] = "Buyer:" if international else "Beneficiar:"
+    seller, buyer = invoice.seller, invoice.buyer
+    language = get_language()
+    header = dict(labels_for(international, buyer.country.code).header)
     header["items"] = [
-        (invoice.seller.name, invoice.buyer.name),
-        (invoice.seller.registration_id, invoice.buyer.registration_id),
-        (invoice.seller.fiscal_code, invoice.buyer.fiscal_code),
-        (invoice.seller.address, invoice.buyer.address),
-        (invoice.seller.country.name, invoice.buyer.country.name),
-        (invoice.seller.bank_account, invoice.buyer.bank_account),
-        (invoice.seller.bank_name, invoice.buyer.bank_name),
+        (seller.name, buyer.name),
+        (seller.registration_id, buyer.registration_id),
+        (seller.fiscal_code, buyer.fiscal_code),
+        (seller.address, buyer.address),
+        (country_name(seller.country.code, language), country_name(buyer.country.code, language)),
+        (seller.bank_account, buyer.bank_account),
+        (seller.bank_name, buyer.bank_name),
     ]
     return header
 
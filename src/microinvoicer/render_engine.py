@@ -0,0 +1,105 @@
+"""Bounded render concurrency, a wkhtmltopdf process per document and a queue for the excess"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pdfkit
+from django.conf import settings
+
+
+class RenderQueueTimeout(Exception):
+    """Renderer did not pick up (or finish) the job in time"""
+
+
+class RenderPool:
+    """Limits concurrent wkhtmltopdf processes, queues the excess with a timeout"""
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-render")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._configuration = None
+        self._counters = dict(
+            active=0,
+            waiting=0,
+            peak=0,
+            rendered=0,
+            failed=0,
+            rejected=0,
+            timed_out=0,
+            wait_seconds=0.0,
+            render_seconds=0.0,
+        )
+
+    def render(self, html: str, options: dict) -> bytes:
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count(rejected=1)
+            raise RenderQueueTimeout(f"No renderer available after {self.timeout} seconds")
+
+        self._count(waiting=1)
+        future = self._executor.submit(self._run, html, options, started)
+        future.add_done_callback(lambda _: self._slots.release())
+
+        remaining = self.timeout - (time.monotonic() - started)
+        try:
+            return future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            self._count(timed_out=1)
+            if future.cancel():
+                self._count(waiting=-1)
+            raise RenderQueueTimeout(f"Rendering took more than {self.timeout} seconds")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._counters)
+        capacity = self.workers + self.queue_size
+        metrics.update(
+            workers=self.workers,
+            queue_size=self.queue_size,
+            timeout=self.timeout,
+            saturation=(metrics["active"] + metrics["waiting"]) / capacity,
+        )
+        return metrics
+
+    def _run(self, html, options, started):
+        self._count(waiting=-1, active=1, wait_seconds=time.monotonic() - started)
+        render_started = time.monotonic()
+        try:
+            content = pdfkit.from_string(html, options=options, configuration=self.configuration)
+        except Exception:
+            self._count(failed=1)
+            raise
+        else:
+            self._count(rendered=1)
+            return content
+        finally:
+            self._count(active=-1, render_seconds=time.monotonic() - render_started)
+
+    @property
+    def configuration(self):
+        """Resolves wkhtmltopdf binary once, instead of on every render"""
+        if self._configuration is None:
+            self._configuration = pdfkit.configuration()
+        return self._configuration
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] += delta
+            busy = self._counters["active"] + self._counters["waiting"]
+            self._counters["peak"] = max(self._counters["peak"], busy)
+
+
+def html_to_pdf(html: str, options: dict) -> bytes:
+    """Plain conversion, used by worker processes outside of the pool"""
+    return pdfkit.from_string(html, options=options)
+
+
+render_pool = RenderPool(
+    settings.PDF_RENDER_WORKERS, settings.PDF_RENDER_QUEUE_SIZE, settings.PDF_RENDER_TIMEOUT
+)
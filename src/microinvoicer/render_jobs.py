@@ -0,0 +1,127 @@
+"""Pdf rendering jobs queued in the database, worked by the render_jobs command or threads"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import pdf_rendering
+from .models import ACTIVE_JOB_STATUSES, JobStatus, RenderJob, RenderKind
+from .render_engine import RenderQueueTimeout
+
+
+RENDERERS = {
+    RenderKind.INVOICE: pdf_rendering.invoice_pdf,
+    RenderKind.TIMESHEET: pdf_rendering.timesheet_pdf,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(kind: str, invoice) -> RenderJob:
+    """New job, or the identical one already queued or running"""
+    while True:
+        active = RenderJob.objects.defer("content").filter(
+            kind=kind, invoice=invoice, status__in=ACTIVE_JOB_STATUSES
+        )
+        if job := active.first():
+            return job
+        try:
+            with transaction.atomic():
+                return RenderJob.objects.create(kind=kind, invoice=invoice)
+        except IntegrityError:
+            # lost the race against an identical request, join its job
+            continue
+
+
+def claim_next():
+    """Oldest queued job, marked running for this worker only"""
+    queued = RenderJob.objects.filter(status=JobStatus.QUEUED).order_by("created_at")
+    for pk in queued.values_list("pk", flat=True)[:10]:
+        claimed = RenderJob.objects.filter(pk=pk, status=JobStatus.QUEUED).update(
+            status=JobStatus.RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return RenderJob.objects.select_related(
+                "invoice__contract", "invoice__seller", "invoice__buyer"
+            ).get(pk=pk)
+
+    return None
+
+
+def run(job: RenderJob):
+    try:
+        content = RENDERERS[job.kind](job.invoice)
+    except RenderQueueTimeout:
+        # renderer pool is saturated, give the job back for later
+        _finish(job, status=JobStatus.QUEUED, started_at=None)
+    except Exception as error:
+        logger.exception("Rendering %r failed", job)
+        _finish(job, status=JobStatus.FAILED, error=str(error), finished_at=timezone.now())
+    else:
+        _finish(job, status=JobStatus.DONE, content=content, finished_at=timezone.now())
+
+
+def work_queued() -> int:
+    """Runs jobs until the queue is empty, returns how many were run"""
+    done = 0
+    while job := claim_next():
+        run(job)
+        done += 1
+    return done
+
+
+def requeue_stale() -> int:
+    """Jobs left running by a worker that went away"""
+    stale_since = timezone.now() - timedelta(seconds=2 * settings.PDF_RENDER_TIMEOUT)
+    return RenderJob.objects.filter(status=JobStatus.RUNNING, started_at__lt=stale_since).update(
+        status=JobStatus.QUEUED, started_at=None
+    )
+
+
+def purge() -> int:
+    """Drops finished jobs older than the retention period"""
+    finished_before = timezone.now() - timedelta(seconds=settings.RENDER_JOB_RETENTION)
+    deleted, _ = RenderJob.objects.filter(
+        status__in=[JobStatus.DONE, JobStatus.FAILED], finished_at__lt=finished_before
+    ).delete()
+    return deleted
+
+
+def _finish(job, **fields):
+    RenderJob.objects.filter(pk=job.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+class RenderWorker(threading.Thread):
+    """Polls the job queue, from within the web process or the render_jobs command"""
+
+    def __init__(self, poll_interval, name="render-worker"):
+        super().__init__(name=name, daemon=True)
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                requeue_stale()
+                purge()
+                work_queued()
+            except Exception:
+                logger.exception("Render worker iteration failed")
+            finally:
+                connection.close()
+            self.stopped.wait(self.poll_interval)
+
+
+def start_workers(count=None):
+    workers = [
+        RenderWorker(settings.RENDER_JOB_POLL, name=f"render-worker-{index}")
+        for index in range(count or settings.RENDER_JOB_THREADS)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
@@ -0,0 +1,103 @@
+"""Monthly revenue rollup, kept in step with invoice writes"""
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from .managers import invoice_value_expression
+from .models import InvoiceStatus, MonthlyRevenue, TimeInvoice
+
+
+def account(invoice: TimeInvoice, sign: int):
+    """Adds (sign=1) or removes (sign=-1) invoice contribution, storno invoices have none"""
+    if invoice is None or invoice.status == InvoiceStatus.STORNO:
+        return
+
+    key = dict(
+        registry_id=invoice.registry_id,
+        year=invoice.issue_date.year,
+        month=invoice.issue_date.month,
+        currency=invoice.currency,
+    )
+    changes = dict(total=F("total") + sign * invoice.value, count=F("count") + sign)
+    with transaction.atomic():
+        if not MonthlyRevenue.objects.filter(**key).update(**changes):
+            if sign < 0:
+                # never accounted, or its row is being deleted already
+                return
+            try:
+                with transaction.atomic():
+                    MonthlyRevenue.objects.create(**key, total=sign * invoice.value, count=sign)
+            except IntegrityError:
+                # created concurrently, right after our update missed it
+                MonthlyRevenue.objects.filter(**key).update(**changes)
+        MonthlyRevenue.objects.filter(**key, count=0).delete()
+
+
+def rebuild(registries=None):
+    """Recomputes rollup rows from invoices, for all or some registries"""
+    invoices = TimeInvoice.objects.exclude(status=InvoiceStatus.STORNO)
+    revenues = MonthlyRevenue.objects.all()
+    if registries is not None:
+        invoices = invoices.filter(registry__in=registries)
+        revenues = revenues.filter(registry__in=registries)
+
+    rows = (
+        invoices.annotate(year=ExtractYear("issue_date"), month=ExtractMonth("issue_date"))
+        .values("registry_id", "year", "month", "currency")
+        .annotate(month_total=Sum(invoice_value_expression()), month_count=Count("pk"))
+        .order_by()
+    )
+    with transaction.atomic():
+        revenues.delete()
+        created = MonthlyRevenue.objects.bulk_create(
+            [
+                MonthlyRevenue(
+                    registry_id=row["registry_id"],
+                    year=row["year"],
+                    month=row["month"],
+                    currency=row["currency"],
+                    total=row["month_total"],
+                    count=row["month_count"],
+                )
+                for row in rows
+            ],
+            batch_size=500,
+        )
+
+    return len(created)
+
+
+def monthly_totals(revenues) -> list:
+    """Value and count of invoices by (month, currency), most recent first, read from the rollup"""
+    rows = (
+        revenues.values("year", "month", "currency")
+        .annotate(month_total=Sum("total"), month_count=Sum("count"))
+        .order_by("-year", "-month", "currency")
+    )
+    return [
+        dict(
+            month=date(row["year"], row["month"], 1),
+            currency=row["currency"],
+            total=row["month_total"],
+            count=row["month_count"],
+        )
+        for row in rows
+    ]
+
+
+def year_totals(revenues, year) -> dict:
+    """registry id -> [(currency, total, count)] for one year"""
+    rows = (
+        revenues.filter(year=year)
+        .values("registry_id", "currency")
+        .annotate(year_total=Sum("total"), year_count=Sum("count"))
+        .order_by("registry_id", "currency")
+    )
+    totals = dict()
+    for row in rows:
+        totals.setdefault(row["registry_id"], []).append(
+            (row["currency"], row["year_total"], row["year_count"])
+        )
+    return totals
@@ -0,0 +1,245 @@
+"""Romanian SAF-T (D406) sales report of a registry, written incrementally"""
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from xml.sax.saxutils import XMLGenerator
+
+from . import efactura, models
+from .bulk_export import StreamBuffer
+from .exchange_rates import rate_store
+
+NAMESPACE = "mfp:anaf:dgti:d406:declaratie:v1"
+AUDIT_FILE_VERSION = "2.4.8"
+SOFTWARE = "micro-invoicer"
+# chart of accounts: customers, revenue from services
+CUSTOMERS_ACCOUNT = "4111"
+SERVICES_ACCOUNT = "704"
+VAT_TAX_TYPE = "300"
+# ANAF tax code nomenclature, by e-Factura category and percent
+TAX_CODES = {
+    ("S", Decimal(19)): "310309",
+    ("S", Decimal(9)): "310310",
+    ("S", Decimal(5)): "310311",
+    ("AE", Decimal(0)): "310351",
+    ("E", Decimal(0)): "310320",
+    ("O", Decimal(0)): "310321",
+}
+
+
+class D406Export:
+    """A first pass over the invoices adds up the totals the header needs, a second one writes
+
+    Invoices are read a chunk at a time in both passes and only exchange rates are kept
+    around, so memory does not grow with the period.
+    """
+
+    def __init__(self, registry: models.MicroRegistry, since: date, until: date, chunk_size=500):
+        self.registry = registry
+        self.since, self.until = since, until
+        self.chunk_size = chunk_size
+        self.rates = dict()
+        self.prepared = False
+        self.count, self.total_credit, self.tax_codes = 0, Decimal(0), set()
+
+    def invoices(self):
+        return (
+            self.registry.invoices.filter(issue_date__range=(self.since, self.until))
+            .filter(status=models.InvoiceStatus.PUBLISHED)
+            .select_related("seller", "buyer")
+            .order_by("issue_date", "number")
+        )
+
+    def prepare(self):
+        """Totals of the sales invoices, raises ValueError on missing rates or tax codes"""
+        self.count, self.total_credit, self.tax_codes = 0, Decimal(0), set()
+        for invoice in self.invoices().iterator(chunk_size=self.chunk_size):
+            rate = self.ron_rate(invoice)
+            for line in efactura.invoice_lines(invoice):
+                self.total_credit += efactura.rounded(line["value"] * rate)
+                tax_code(*line["category"])
+                self.tax_codes.add(line["category"])
+            self.count += 1
+        self.prepared = True
+
+    def ron_rate(self, invoice) -> Decimal:
+        key = (invoice.currency, invoice.issue_date)
+        if key not in self.rates:
+            self.rates[key] = rate_store.rate_on(invoice.currency, invoice.issue_date)
+            if self.rates[key] is None:
+                raise ValueError(
+                    f"No BNR rate for {invoice.currency} on {invoice.issue_date}, "
+                    f"needed by {invoice.series_number}"
+                )
+        return self.rates[key]
+
+    def chunks(self):
+        """Yields the xml file in pieces, one invoice at a time, preparing the totals first"""
+        if not self.prepared:
+            self.prepare()
+
+        stream = StreamBuffer()
+        xml = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+        xml.startDocument()
+        with opened(xml, "AuditFile", {"xmlns": NAMESPACE}):
+            self.write_header(xml)
+            with opened(xml, "MasterFiles"):
+                self.write_customers(xml)
+                self.write_tax_table(xml)
+            yield stream.drain()
+
+            with opened(xml, "SourceDocuments"), opened(xml, "SalesInvoices"):
+                text(xml, "NumberOfEntries", self.count)
+                text(xml, "TotalDebit", "0.00")
+                text(xml, "TotalCredit", f"{self.total_credit:.2f}")
+                for invoice in self.invoices().iterator(chunk_size=self.chunk_size):
+                    self.write_invoice(xml, invoice)
+                    yield stream.drain()
+        xml.endDocument()
+        yield stream.drain()
+
+    def write_header(self, xml):
+        seller = self.registry.seller
+        with opened(xml, "Header"):
+            text(xml, "AuditFileVersion", AUDIT_FILE_VERSION)
+            text(xml, "AuditFileCountry", "RO")
+            text(xml, "AuditFileDateCreated", date.today().isoformat())
+            text(xml, "SoftwareCompanyName", SOFTWARE)
+            text(xml, "SoftwareID", SOFTWARE)
+            text(xml, "SoftwareVersion", AUDIT_FILE_VERSION)
+            with opened(xml, "Company"):
+                text(xml, "RegistrationNumber", seller.fiscal_code)
+                text(xml, "Name", seller.name)
+                address(xml, "Address", seller)
+                with opened(xml, "BankAccount"):
+                    text(xml, "IBANNumber", seller.bank_account)
+            text(xml, "DefaultCurrencyCode", "RON")
+            with opened(xml, "SelectionCriteria"):
+                text(xml, "SelectionStartDate", self.since.isoformat())
+                text(xml, "SelectionEndDate", self.until.isoformat())
+            text(xml, "HeaderComment", "L" if (self.until - self.since).days < 31 else "T")
+            text(xml, "SegmentIndex", 1)
+            text(xml, "TotalSegmentsInsequence", 1)
+            text(xml, "TaxAccountingBasis", "A")
+
+    def write_customers(self, xml):
+        """Buyers invoiced in the period, balances are not tracked so they stay at zero"""
+        buyers = models.FiscalEntity.objects.filter(pk__in=self.invoices().values("buyer"))
+        with opened(xml, "Customers"):
+            for buyer in buyers.order_by("pk").iterator(chunk_size=self.chunk_size):
+                with opened(xml, "Customer"):
+                    with opened(xml, "CompanyStructure"):
+                        text(xml, "RegistrationNumber", buyer.fiscal_code)
+                        text(xml, "Name", buyer.name)
+                        address(xml, "Address", buyer)
+                    text(xml, "CustomerID", buyer.fiscal_code)
+                    text(xml, "AccountID", CUSTOMERS_ACCOUNT)
+                    text(xml, "OpeningDebitBalance", "0.00")
+                    text(xml, "ClosingDebitBalance", "0.00")
+
+    def write_tax_table(self, xml):
+        with opened(xml, "TaxTable"), opened(xml, "TaxTableEntry"):
+            text(xml, "TaxType", VAT_TAX_TYPE)
+            text(xml, "Description", "TVA")
+            for category, percent in sorted(self.tax_codes):
+                with opened(xml, "TaxCodeDetails"):
+                    text(xml, "TaxCode", tax_code(category, percent))
+                    text(xml, "Description", tax_description(category, percent))
+                    text(xml, "TaxPercentage", f"{percent:.2f}")
+                    text(xml, "Country", "RO")
+
+    def write_invoice(self, xml, invoice):
+        rate = self.ron_rate(invoice)
+        currency = invoice.currency.upper()
+        with opened(xml, "Invoice"):
+            text(xml, "InvoiceNo", invoice.series_number)
+            with opened(xml, "CustomerInfo"):
+                text(xml, "CustomerID", invoice.buyer.fiscal_code)
+                address(xml, "BillingAddress", invoice.buyer)
+            text(xml, "AccountID", CUSTOMERS_ACCOUNT)
+            text(xml, "Period", invoice.issue_date.month)
+            text(xml, "PeriodYear", invoice.issue_date.year)
+            text(xml, "InvoiceDate", invoice.issue_date.isoformat())
+            text(xml, "InvoiceType", efactura.INVOICE.type_code)
+            text(xml, "SelfBillingIndicator", 0)
+
+            net, taxes = Decimal(0), dict()
+            for number, line in enumerate(efactura.invoice_lines(invoice), start=1):
+                _, percent = line["category"]
+                tax = efactura.rounded(line["value"] * percent / 100)
+                with opened(xml, "Line"):
+                    text(xml, "LineNumber", number)
+                    text(xml, "AccountID", SERVICES_ACCOUNT)
+                    text(xml, "Quantity", line["quantity"])
+                    text(xml, "UnitOfMeasure", line["unit"])
+                    text(xml, "UnitPrice", f"{line['price']:.4f}")
+                    text(xml, "TaxPointDate", invoice.issue_date.isoformat())
+                    text(xml, "Description", line["name"])
+                    money(xml, "InvoiceLineAmount", line["value"], currency, rate)
+                    text(xml, "DebitCreditIndicator", "C")
+                    tax_information(xml, line["category"], line["value"], tax, currency, rate)
+                net += efactura.rounded(line["value"] * rate)
+                base, amount = taxes.get(line["category"], (0, 0))
+                taxes[line["category"]] = (base + line["value"], amount + tax)
+
+            with opened(xml, "DocumentTotals"):
+                gross = net
+                for category, (base, tax) in taxes.items():
+                    tax_information(
+                        xml, category, base, tax, currency, rate, tag="TaxInformationTotals"
+                    )
+                    gross += efactura.rounded(tax * rate)
+                text(xml, "NetTotal", f"{net:.2f}")
+                text(xml, "GrossTotal", f"{gross:.2f}")
+
+
+@contextmanager
+def opened(xml, name, attributes=None):
+    xml.startElement(name, attributes or {})
+    yield
+    xml.endElement(name)
+
+
+def text(xml, name, value):
+    xml.startElement(name, {})
+    xml.characters(str(value))
+    xml.endElement(name)
+
+
+def address(xml, name, entity):
+    street, city = efactura.address_parts(entity)
+    with opened(xml, name):
+        text(xml, "StreetName", street)
+        text(xml, "City", city)
+        text(xml, "Country", entity.country.code)
+
+
+def money(xml, name, value, currency, rate):
+    """Amount in lei, with the original currency amount alongside"""
+    with opened(xml, name):
+        text(xml, "Amount", f"{efactura.rounded(value * rate):.2f}")
+        text(xml, "CurrencyCode", currency)
+        text(xml, "CurrencyAmount", f"{value:.2f}")
+        text(xml, "ExchangeRate", f"{rate:.4f}")
+
+
+def tax_information(xml, category, base, tax, currency, rate, tag="TaxInformation"):
+    category, percent = category
+    with opened(xml, tag):
+        text(xml, "TaxType", VAT_TAX_TYPE)
+        text(xml, "TaxCode", tax_code(category, percent))
+        text(xml, "TaxPercentage", f"{percent:.2f}")
+        text(xml, "TaxBase", f"{efactura.rounded(base * rate):.2f}")
+        money(xml, "TaxAmount", tax, currency, rate)
+
+
+def tax_description(category, percent) -> str:
+    if category in efactura.EXEMPTIONS:
+        return efactura.EXEMPTIONS[category][1]
+    return f"TVA {percent:.0f}%"
+
+
+def tax_code(category, percent) -> str:
+    try:
+        return TAX_CODES[category, percent]
+    except KeyError:
+        raise ValueError(f"No SAF-T tax code for VAT {category} {percent}%") from None
@@ -0,0 +1,42 @@
+"""Model signal receivers, connected when the application is ready"""
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import models, rollups
+from .pdf_cache import invoice_cache
+
+
+@receiver(post_save, sender=models.TimeInvoice)
+@receiver(post_delete, sender=models.TimeInvoice)
+def drop_invoice_pdf(sender, instance, **kwargs):
+    invoice_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=models.FiscalEntity)
+def drop_entity_pdfs(sender, instance, **kwargs):
+    invoice_ids = models.TimeInvoice.objects.filter(
+        Q(seller=instance) | Q(buyer=instance)
+    ).values_list("pk", flat=True)
+    invoice_cache.invalidate(*invoice_ids)
+
+
+@receiver(pre_save, sender=models.TimeInvoice)
+def remember_previous_invoice(sender, instance, **kwargs):
+    instance._previous = None
+    if not instance._state.adding:
+        instance._previous = models.TimeInvoice.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=models.TimeInvoice)
+def update_revenue_on_save(sender, instance, **kwargs):
+    rollups.account(instance._previous, -1)
+    rollups.account(instance, 1)
+
+
+@receiver(post_delete, sender=models.TimeInvoice)
+def update_revenue_on_delete(sender, instance, origin=None, **kwargs):
+    # rollup rows go away with the registry or user whose deletion cascaded here
+    deleted = getattr(origin, "model", type(origin))
+    if deleted not in (models.MicroRegistry, models.MicroUser):
+        rollups.account(instance, -1)
@@ -1,13 +0,0 @@
-import locale
-
-
-class TemporaryLocale:
-    def __init__(self, localename):
-        self.name = localename
-
-    def __enter__(self):
-        self.orig = locale.setlocale(locale.LC_CTYPE)
-        locale.setlocale(locale.LC_ALL, self.name)
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        locale.setlocale(locale.LC_ALL, self.orig)
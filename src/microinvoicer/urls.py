@@ -27,11 +27,41 @@ urlpatterns = [
         views.ContractDeleteView.as_view(),
         name="registry-contract-delete",
     ),
+    path(
+        "registry/<registry_id>/invoices",
+        views.TimeInvoiceListView.as_view(),
+        name="registry-invoice-list",
+    ),
     path(
         "registry/<registry_id>/invoice/add",
         views.TimeInvoiceCreateView.as_view(),
         name="registry-invoice-add",
     ),
+    path(
+        "registry/<registry_id>/invoice/import",
+        views.TimeInvoiceImportView.as_view(),
+        name="registry-invoice-import",
+    ),
+    path(
+        "registry/<registry_id>/invoice/export",
+        views.TimeInvoiceExportView.as_view(),
+        name="registry-invoice-export",
+    ),
+    path(
+        "registry/<registry_id>/invoice/ledger",
+        views.LedgerExportView.as_view(),
+        name="registry-invoice-ledger",
+    ),
+    path(
+        "registry/<registry_id>/invoice/efactura",
+        views.EFacturaExportView.as_view(),
+        name="registry-invoice-efactura-export",
+    ),
+    path(
+        "registry/<registry_id>/saft",
+        views.SaftExportView.as_view(),
+        name="registry-saft",
+    ),
     path(
         "registry/<registry_id>/invoice/<pk>/detail",
         views.TimeInvoiceDetailView.as_view(),
@@ -52,7 +82,15 @@ urlpatterns = [
         views.TimeInvoiceFakeTimesheetView.as_view(),
         name="registry-invoice-timesheet",
     ),
+    path(
+        "registry/<registry_id>/invoice/<pk>/efactura",
+        views.EFacturaView.as_view(),
+        name="registry-invoice-efactura",
+    ),
     path("home/", views.MicroHomeView.as_view(), name="home"),
     path("report/", views.ReportView.as_view(), name="report"),
+    path("ledger/", views.LedgerExportView.as_view(), name="ledger"),
+    path("jobs/render/<int:pk>", views.RenderJobView.as_view(), name="render-job"),
+    path("metrics/render", views.RenderMetricsView.as_view(), name="render-metrics"),
     path("", views.IndexView.as_view(), name="index"),
 ]
@@ -1,21 +1,45 @@
 """How about now."""
+import io
 from datetime import date, timedelta, datetime
-from django.http import FileResponse
-from django.urls import reverse_lazy
-from django.views.generic import TemplateView
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.shortcuts import get_object_or_404
+from django.urls import reverse, reverse_lazy
+from django.views.generic import TemplateView, View
 from django.views.generic.detail import DetailView
-from django.views.generic.edit import CreateView, DeleteView, UpdateView
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views.generic.edit import CreateView, DeleteView, FormView, UpdateView
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.views import LoginView
 from django.forms.models import model_to_dict
 from django.template import Template, Context
 from django_registration.backends.one_step.views import RegistrationView
 from dateutil.rrule import rrule, MONTHLY
-from django.apps import apps
-from decimal import Decimal
 
-from . import forms, models, pdf_rendering, micro_timesheet
-from .temporary_locale import TemporaryLocale
+from . import (
+    bulk_export,
+    efactura,
+    formatting,
+    forms,
+    importer,
+    ledger,
+    models,
+    pdf_rendering,
+    render_jobs,
+    rollups,
+    saft,
+)
+from .exchange_rates import rate_store
+from .managers import related_count
+from .render_engine import RenderQueueTimeout, render_pool
 
 
 class IndexView(TemplateView):
@@ -51,36 +75,57 @@ class MicroHomeView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         if self.request.user.is_authenticated:
             user = self.request.user
-            context["registries"] = user.registries.prefetch_related(
-                "seller", "contracts", "invoices"
-            ).all()
+            registries = (
+                user.registries.select_related("seller")
+                .annotate(
+                    invoice_count=related_count(models.TimeInvoice.objects),
+                    contract_count=related_count(models.ServiceContract.objects),
+                )
+                .prefetch_related(
+                    Prefetch(
+                        "invoices",
+                        queryset=models.TimeInvoice.objects.select_related("buyer")
+                        .with_value()
+                        .order_by("-issue_date", "-number")[: settings.DASHBOARD_INVOICES],
+                        to_attr="latest_invoices",
+                    ),
+                    Prefetch(
+                        "contracts",
+                        queryset=models.ServiceContract.objects.select_related("buyer").order_by(
+                            "-pk"
+                        ),
+                    ),
+                )
+            )
+            year_revenues = rollups.year_totals(
+                models.MonthlyRevenue.objects.filter(registry__user=user), date.today().year
+            )
+            for registry in registries:
+                registry.year_revenue = year_revenues.get(registry.pk, [])
+            context["registries"] = registries
+            context["dashboard_invoices"] = settings.DASHBOARD_INVOICES
+            context["this_year"] = date.today().year
 
         return context
 
 
 class ReportView(LoginRequiredMixin, TemplateView):
-
     template_name = "report.html"
 
     def get_context_data(self, **kwargs):
         """Computes quarterly reports"""
-        app_config = apps.get_app_config("microinvoicer")
-        daily_rates = app_config.daily_rates
-        daily_rates["ron"] = Decimal(1)
-        average_rates = app_config.average_rates
-
         context = super().get_context_data(**kwargs)
 
-        invoices = models.TimeInvoice.objects.filter(registry__user=self.request.user).order_by(
-            "-issue_date"
+        monthly_totals = rollups.monthly_totals(
+            models.MonthlyRevenue.objects.filter(registry__user=self.request.user)
         )
 
         # build up the monthly / quartery / yearly total
         totals = dict()
-        if invoices:
+        if monthly_totals:
             # fill in all spots between first and last invoice in reverse order
-            since = invoices.last().issue_date.replace(day=1)
-            until = invoices.first().issue_date.replace(day=1)
+            since = monthly_totals[-1]["month"]
+            until = monthly_totals[0]["month"]
             all_months = list(rrule(freq=MONTHLY, dtstart=since, until=until, bymonthday=1))
             for every_month in reversed(all_months):
                 year = every_month.year
@@ -94,30 +139,28 @@ class ReportView(LoginRequiredMixin, TemplateView):
                 if month not in totals[year][quarter]:
                     totals[year][quarter][month] = dict(total=0, count=0, date=every_month)
 
-        for invoice in invoices:
-            year = invoice.issue_date.year
-            quarter = models.quarter_of(invoice.issue_date)
-            month = invoice.issue_date.month
-            use_date = invoice.issue_date.replace(day=1)
-            conversion_rate = average_rates.get(use_date, daily_rates[invoice.currency])
-
-            value = invoice.value * conversion_rate
-
-            total_year = totals.get(year, dict(total=0))
-            total_year["total"] += value
-            total_quarter = total_year.get(quarter, dict(total=0))
-            total_quarter["total"] += value
-
-            total_month = total_quarter.get(month, dict(total=0, count=0))
-            total_month["total"] += value
-            total_month["count"] += 1
-            total_month["date"] = invoice.issue_date
-
-            total_quarter[month] = total_month
-            total_year[quarter] = total_quarter
-            totals[year] = total_year
+        # only the currency conversion is left for python, once per month and currency
+        missing_rates = []
+        for row in monthly_totals:
+            month = row["month"]
+            total_year = totals[month.year]
+            total_quarter = total_year[models.quarter_of(month)]
+            total_month = total_quarter[month.month]
+            total_month["count"] += row["count"]
+
+            rate = rate_store.month_rate(row["currency"], month)
+            if rate is None:
+                # left out of the totals, and listed so nobody takes them as complete
+                total_month.setdefault("missing", []).append(row["currency"])
+                missing_rates.append(row)
+                continue
+
+            value = row["total"] * rate
+            for total in (total_year, total_quarter, total_month):
+                total["total"] += value
 
         context["totals"] = totals
+        context["missing_rates"] = missing_rates
 
         return context
 
@@ -296,21 +339,21 @@ class TimeInvoiceCreateView(MicroFormMixin, CreateView):
         registry = models.MicroRegistry.objects.get(pk=self.kwargs["registry_id"])
         initial["include_vat"] = registry.include_vat
         self.kwargs["registry"] = registry
-        last_invoice = registry.invoices.last()
+        last_invoice = registry.invoices.order_by("-issue_date", "-number").first()
         if last_invoice:
             initial["contract"] = last_invoice.contract
             initial["quantity"] = last_invoice.quantity
 
-            use_locale = "ro_RO" if last_invoice.contract.buyer.country == "RO" else "en_IE"
-            with TemporaryLocale(use_locale):
-                description_template = Template(last_invoice.contract.invoicing_description)
-                local_context = Context(
-                    dict(
-                        this_month=date.strftime(today, "%B %Y").title(),
-                        last_month=date.strftime(last_month, "%B %Y").title(),
-                    )
+            country = last_invoice.contract.buyer.country
+            names = formatting.COUNTRY_FORMATS.get(country, formatting.IRISH)
+            description_template = Template(last_invoice.contract.invoicing_description)
+            local_context = Context(
+                dict(
+                    this_month=names.month_year(today).title(),
+                    last_month=names.month_year(last_month).title(),
                 )
-                initial["override_description"] = description_template.render(local_context)
+            )
+            initial["override_description"] = description_template.render(local_context)
 
         return initial
 
@@ -323,7 +366,6 @@ class TimeInvoiceCreateView(MicroFormMixin, CreateView):
         form.instance.seller = registry.seller
         form.instance.buyer = contract.buyer
         form.instance.series = registry.invoice_series
-        form.instance.number = registry.next_invoice_no
         form.instance.status = models.InvoiceStatus.PUBLISHED
         form.instance.currency = contract.invoicing_currency
         form.instance.unit = contract.unit
@@ -335,13 +377,26 @@ class TimeInvoiceCreateView(MicroFormMixin, CreateView):
         else:
             form.instance.description = contract.invoicing_description
 
+        # looked up before the numbering transaction, which then only writes
+        if not form.instance.conversion_rate and contract.currency != contract.invoicing_currency:
+            form.instance.conversion_rate = rate_store.conversion(
+                contract.currency, contract.invoicing_currency, form.instance.issue_date
+            )
+            if form.instance.conversion_rate is None:
+                form.add_error(
+                    "conversion_rate",
+                    f"No BNR rate converting {contract.currency} to {contract.invoicing_currency} "
+                    f"on {form.instance.issue_date}, enter the conversion rate",
+                )
+                return self.form_invalid(form)
+
         if form.cleaned_data["attached_cost"] and form.cleaned_data["attached_description"]:
             form.instance.attached_description = form.cleaned_data["attached_description"]
             form.instance.attached_cost = form.cleaned_data["attached_cost"]
 
-        response = super().form_valid(form)
-        registry.next_invoice_no += 1
-        registry.save()
+        with transaction.atomic():
+            form.instance.number = registry.allocate_invoice_no()
+            response = super().form_valid(form)
         return response
 
 
@@ -350,11 +405,72 @@ class TimeInvoiceDeleteView(MicroFormMixin, DeleteView):
     form_title = "Throwing away invoice"
     template_name = "confirm_delete.html"
 
-    def delete(self, request, *args, **kwargs):
-        invoice = self.get_object()
-        invoice.registry.next_invoice_no -= 1
-        invoice.registry.save()
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            self.object.registry.release_invoice_no(self.object.number)
+        return response
+
+
+class TimeInvoiceImportView(MicroFormMixin, FormView):
+    """Upload of invoicing history kept elsewhere, see importer for the columns"""
+
+    form_title = "Import invoices"
+    form_class = forms.InvoiceImportForm
+
+    def form_valid(self, form):
+        registry = get_object_or_404(
+            models.MicroRegistry, pk=self.kwargs["registry_id"], user=self.request.user
+        )
+        upload = form.cleaned_data["history"]
+        rows = importer.read_rows(upload, importer.format_of(upload.name))
+        try:
+            importer.InvoiceImporter(registry).run(rows)
+        except (UnicodeDecodeError, ValueError) as error:
+            form.add_error("history", str(error))
+            return self.form_invalid(form)
+        return super().form_valid(form)
+
+
+class TimeInvoiceListView(LoginRequiredMixin, TemplateView):
+    """All invoices of a registry, most recent first, with keyset pagination"""
+
+    template_name = "invoice_list.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        registry = get_object_or_404(
+            models.MicroRegistry.objects.select_related("seller"),
+            pk=self.kwargs["registry_id"],
+            user=self.request.user,
+        )
+        invoices = (
+            registry.invoices.select_related("buyer")
+            .with_value()
+            .order_by("-issue_date", "-number")
+        )
+
+        cursor = self.request.GET.get("after")
+        if cursor:
+            try:
+                issue_date, number = cursor.split("_")
+                issue_date, number = date.fromisoformat(issue_date), int(number)
+            except ValueError:
+                raise BadRequest(f"Malformed page cursor {cursor}")
+            invoices = invoices.filter(
+                Q(issue_date__lt=issue_date) | Q(issue_date=issue_date, number__lt=number)
+            )
+
+        page_size = settings.INVOICES_PAGE_SIZE
+        page = list(invoices[: page_size + 1])
+        context["registry"] = registry
+        context["invoices"] = page[:page_size]
+        context["cursor"] = cursor
+        if len(page) > page_size:
+            last = page[page_size - 1]
+            context["next_cursor"] = f"{last.issue_date.isoformat()}_{last.number}"
+
+        return context
 
 
 class TimeInvoiceDetailView(LoginRequiredMixin, DetailView):
@@ -362,18 +478,36 @@ class TimeInvoiceDetailView(LoginRequiredMixin, DetailView):
     template_name = "invoice_detail.html"
 
 
-class TimeInvoicePrintView(LoginRequiredMixin, DetailView):
-    """Download invoice as PDF file"""
+class PdfDownloadMixin(LoginRequiredMixin):
+    """Common requirements for pdf downloads, rendered in place or as a job with ?async=1"""
 
     model = models.TimeInvoice
     response_class = FileResponse
+    render_kind = None
+
+    def get(self, request, *args, **kwargs):
+        """Answers with service unavailable while the renderer pool is saturated"""
+        if request.GET.get("async") == "1":
+            job = render_jobs.enqueue(self.render_kind, self.get_object())
+            return render_job_status(job, status=202)
+
+        try:
+            return super().get(request, *args, **kwargs)
+        except RenderQueueTimeout as error:
+            return HttpResponse(str(error), status=503, headers={"Retry-After": "10"})
+
+
+class TimeInvoicePrintView(PdfDownloadMixin, DetailView):
+    """Download invoice as PDF file"""
+
+    render_kind = models.RenderKind.INVOICE
 
     def render_to_response(self, context, **response_kwargs):
-        """Returns content of generated pdf"""
+        """Returns content of generated pdf, straight from cache when unchanged"""
         invoice = context["object"]
-        content = pdf_rendering.render_invoice(invoice)
+        content = pdf_rendering.invoice_pdf(invoice)
         response = FileResponse(
-            content,
+            io.BytesIO(content),
             filename=f"{invoice.series_number}.pdf",
             as_attachment=True,
             content_type="application/pdf",
@@ -381,28 +515,182 @@ class TimeInvoicePrintView(LoginRequiredMixin, DetailView):
         return response
 
 
-class TimeInvoiceFakeTimesheetView(LoginRequiredMixin, DetailView):
+class TimeInvoiceFakeTimesheetView(PdfDownloadMixin, DetailView):
     """Generate fake timesheet as PDF file"""
 
-    model = models.TimeInvoice
-    response_class = FileResponse
+    render_kind = models.RenderKind.TIMESHEET
 
     def render_to_response(self, context, **response_kwargs):
         """Returns content of generated pdf"""
         invoice = context["object"]
-        if "last_month" in invoice.contract.invoicing_description:
-            start_date = invoice.issue_date.replace(day=1) - timedelta(days=1)
-            start_date = start_date.replace(day=1)
-        else:
-            start_date = invoice.issue_date.replace(day=1)
-        timesheet = micro_timesheet.fake_timesheet(
-            invoice.quantity, "Dashboard", "Web Application", start_date
-        )
-        content = pdf_rendering.render_timesheet(invoice, timesheet)
+        content = pdf_rendering.timesheet_pdf(invoice)
         response = FileResponse(
-            content,
+            io.BytesIO(content),
             filename=f"{invoice.series_number}-timesheet.pdf",
             as_attachment=True,
             content_type="application/pdf",
         )
         return response
+
+
+class RenderJobView(LoginRequiredMixin, View):
+    """Status of a pdf rendering job, the pdf itself once done"""
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(
+            models.RenderJob.objects.select_related("invoice").defer("content"),
+            pk=self.kwargs["pk"],
+            invoice__registry__user=request.user,
+        )
+        if job.status != models.JobStatus.DONE:
+            return render_job_status(job, status=202 if job.is_active else 200)
+
+        content = models.RenderJob.objects.values_list("content", flat=True).get(pk=job.pk)
+        return FileResponse(
+            io.BytesIO(content),
+            filename=job.filename,
+            as_attachment=True,
+            content_type="application/pdf",
+        )
+
+
+def render_job_status(job, status):
+    return JsonResponse(
+        {
+            "job": job.pk,
+            "status": job.status,
+            "error": job.error,
+            "url": reverse("render-job", kwargs={"pk": job.pk}),
+        },
+        status=status,
+    )
+
+
+class TimeInvoiceExportView(LoginRequiredMixin, View):
+    """Download all invoices of a quarter or date range as zip archive"""
+
+    def get(self, request, *args, **kwargs):
+        registry = get_object_or_404(
+            models.MicroRegistry, pk=self.kwargs["registry_id"], user=request.user
+        )
+        try:
+            since, until = bulk_export.parse_period(
+                request.GET.get("quarter"), request.GET.get("since"), request.GET.get("until")
+            )
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+
+        invoices = bulk_export.period_invoices(registry, since, until)
+        documents = bulk_export.invoice_documents(invoices)
+        response = StreamingHttpResponse(
+            bulk_export.zip_documents(documents), content_type="application/zip"
+        )
+        filename = bulk_export.archive_name(registry, since, until)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class LedgerExportView(LoginRequiredMixin, View):
+    """Csv ledger of one registry, or of all registries when none is given"""
+
+    def get(self, request, *args, **kwargs):
+        invoices = models.TimeInvoice.objects.filter(registry__user=request.user)
+        filename = "ledger.csv"
+        if "registry_id" in self.kwargs:
+            registry = get_object_or_404(
+                models.MicroRegistry, pk=self.kwargs["registry_id"], user=request.user
+            )
+            invoices = invoices.filter(registry=registry)
+            filename = f"{registry.invoice_series}-ledger.csv"
+        try:
+            since, until, statuses = ledger.parse_filters(request.GET)
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+
+        invoices = ledger.ledger_invoices(invoices, since, until, statuses)
+        response = StreamingHttpResponse(
+            ledger.ledger_lines(invoices), content_type="text/csv; charset=utf-8"
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class EFacturaView(LoginRequiredMixin, View):
+    """Download invoice as e-Factura xml"""
+
+    def get(self, request, *args, **kwargs):
+        invoice = get_object_or_404(
+            models.TimeInvoice.objects.select_related("seller", "buyer", "contract"),
+            pk=self.kwargs["pk"],
+            registry_id=self.kwargs["registry_id"],
+            registry__user=request.user,
+        )
+        try:
+            content = efactura.invoice_xml(invoice)
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+
+        response = HttpResponse(content, content_type="application/xml")
+        filename = f"{efactura.document_id(invoice)}.xml"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class EFacturaExportView(LoginRequiredMixin, View):
+    """Download e-Factura xml of all romanian invoices of a period as zip archive"""
+
+    def get(self, request, *args, **kwargs):
+        registry = get_object_or_404(
+            models.MicroRegistry.objects.select_related("seller"),
+            pk=self.kwargs["registry_id"],
+            user=request.user,
+        )
+        try:
+            since, until = bulk_export.parse_period(
+                request.GET.get("quarter"), request.GET.get("since"), request.GET.get("until")
+            )
+            efactura.check_period(registry, since, until)
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+
+        documents = efactura.period_documents(registry, since, until)
+        response = StreamingHttpResponse(
+            bulk_export.zip_documents(documents), content_type="application/zip"
+        )
+        filename = f"efactura-{bulk_export.archive_name(registry, since, until)}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class SaftExportView(LoginRequiredMixin, View):
+    """Download the SAF-T (D406) sales report of a quarter or date range"""
+
+    def get(self, request, *args, **kwargs):
+        registry = get_object_or_404(
+            models.MicroRegistry.objects.select_related("seller"),
+            pk=self.kwargs["registry_id"],
+            user=request.user,
+        )
+        try:
+            since, until = bulk_export.parse_period(
+                request.GET.get("quarter"), request.GET.get("since"), request.GET.get("until")
+            )
+            export = saft.D406Export(registry, since, until)
+            export.prepare()
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+
+        response = StreamingHttpResponse(export.chunks(), content_type="application/xml")
+        filename = f"D406-{registry.invoice_series}-{since.isoformat()}-{until.isoformat()}.xml"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class RenderMetricsView(UserPassesTestMixin, View):
+    """Pdf renderer pool saturation, for staff only"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(render_pool.metrics())
@@ -3,9 +3,11 @@ Django settings for microtools project.
 """
 import os
 
+from .database import database_config
 
-DEBUG = True
-ALLOWED_HOSTS = []
+
+DEBUG = os.environ.get("MICRO_DEBUG", "1") == "1"
+ALLOWED_HOSTS = [host for host in os.environ.get("MICRO_ALLOWED_HOSTS", "").split(",") if host]
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -24,6 +26,7 @@ INSTALLED_APPS = [
 ] + LOCAL_APPS
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -51,10 +54,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "microtools.wsgi.application"
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
-    }
+    "default": database_config(
+        os.environ.get("DATABASE_URL", "sqlite:///" + os.path.join(BASE_DIR, "db.sqlite3")),
+        conn_max_age=int(os.environ.get("MICRO_DB_CONN_MAX_AGE", 60)),
+        pool=os.environ.get("MICRO_DB_POOL", "") == "1",
+    )
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -85,8 +89,38 @@ LOGOUT_REDIRECT_URL = "/"
 ACCOUNT_ACTIVATION_DAYS = 7
 
 STATIC_URL = "static/"
+STATIC_ROOT = os.environ.get(
+    "MICRO_STATIC_ROOT", os.path.join(os.path.dirname(BASE_DIR), "shared", "static")
+)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    # hashed names are cached forever by whitenoise, gzip and brotli variants are prebuilt
+    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+}
 
 SECRET_KEY = os.environ.get("MICRO_SERVER_SECRET", "fake-key please update on deployment")
 
+# wkhtmltopdf converts the html templates, reportlab draws the same layout in process
+PDF_BACKEND = os.environ.get("MICRO_PDF_BACKEND", "wkhtmltopdf")
+PDF_CACHE_DIR = os.environ.get("MICRO_PDF_CACHE_DIR", os.path.join(BASE_DIR, "cache", "pdf"))
+PDF_CACHE_MAX_BYTES = int(os.environ.get("MICRO_PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+PDF_RENDER_WORKERS = int(os.environ.get("MICRO_PDF_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_RENDER_QUEUE_SIZE = int(os.environ.get("MICRO_PDF_RENDER_QUEUE_SIZE", 16))
+PDF_RENDER_TIMEOUT = float(os.environ.get("MICRO_PDF_RENDER_TIMEOUT", 60))
+# rendering processes of the export_invoices command, the web export renders in the request
+PDF_EXPORT_WORKERS = int(os.environ.get("MICRO_PDF_EXPORT_WORKERS", os.cpu_count() or 1))
+# threads working queued pdf jobs inside each web process, one under serve, zero leaves it
+# to the render_jobs command
+RENDER_JOB_THREADS = int(os.environ.get("MICRO_RENDER_JOB_THREADS", 0))
+RENDER_JOB_POLL = float(os.environ.get("MICRO_RENDER_JOB_POLL", 1))
+RENDER_JOB_RETENTION = int(os.environ.get("MICRO_RENDER_JOB_RETENTION", 3600))
+BNR_BASE_URL = os.environ.get("MICRO_BNR_BASE_URL", "https://www.bnr.ro")
+BNR_YEARLY_URL = BNR_BASE_URL + "/files/xml/years/nbrfxrates{year}.xml"
+# seconds between in-process refreshes, zero leaves it to the refresh_rates command
+BNR_REFRESH_INTERVAL = int(os.environ.get("MICRO_BNR_REFRESH_INTERVAL", 0))
+BNR_TIMEOUT = float(os.environ.get("MICRO_BNR_TIMEOUT", 10))
+DASHBOARD_INVOICES = 10
+INVOICES_PAGE_SIZE = 50
+
 COUNTRIES_ONLY = ["RO", "CH", "IE", "NL"]
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"